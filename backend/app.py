@@ -1,9 +1,7 @@
-# Simple startup file for Render deployment
+# ASGI entry point (`uvicorn app:app` for local runs); production starts
+# through start.py
 from gateway.main import app
 
-# This file serves as the entry point for Render
 if __name__ == "__main__":
-    import uvicorn
-    import os
-    port = int(os.environ.get("PORT", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
\ No newline at end of file
+    from start import main
+    main()
@@ -0,0 +1,74 @@
+"""
+Statements that create user profiles.
+
+Ids are generated here rather than by the database, so a profile and its
+photo (whose URL embeds the id) can go out in a single statement. Inserts
+use ON CONFLICT (mobile_no) DO NOTHING, so a taken number comes back as
+"no row returned" instead of a unique-violation error, however many
+registrations race for it.
+"""
+
+from sqlalchemy import select, literal, LargeBinary
+from sqlalchemy.dialects.postgresql import insert
+from .models import UserProfile, UserProfilePhoto, profile_photo_path
+import hashlib
+import uuid
+
+profiles = UserProfile.__table__
+photos = UserProfilePhoto.__table__
+
+# Columns a caller may set when creating a profile
+PROFILE_FIELDS = (
+    "full_name", "mobile_no", "gender", "category", "address_line", "city", "state",
+    "country", "pincode", "latitude", "longitude", "profile_photo_url",
+)
+
+
+def new_profile_row(fields: dict, password_hash: str) -> dict:
+    row = {name: fields.get(name) for name in PROFILE_FIELDS}
+    row["id"] = uuid.uuid4()
+    row["password"] = password_hash
+    return row
+
+
+def attach_photo(row: dict, data: bytes, mime_type: str) -> dict:
+    """Point row at a stored photo; returns the user_profile_photos row"""
+    digest = hashlib.sha256(data).hexdigest()
+    row["profile_photo_url"] = profile_photo_path(row["id"], digest)
+    row["profile_photo_mime_type"] = mime_type
+    return {"user_id": row["id"], "data": data, "mime_type": mime_type, "sha256": digest, "size": len(data)}
+
+
+def register_statement(row: dict, photo: dict | None = None):
+    """One statement inserting the profile (and its photo); selects the new
+    id, or nothing if the mobile number is taken"""
+    new_profile = (
+        insert(profiles).values(row)
+        .on_conflict_do_nothing(index_elements=[profiles.c.mobile_no])
+        .returning(profiles.c.id)
+        .cte("new_profile")
+    )
+    stmt = select(new_profile.c.id)
+    if photo is not None:
+        # Selecting from new_profile means the photo is only written if the profile was
+        new_photo = insert(photos).from_select(
+            ["user_id", "data", "mime_type", "sha256", "size"],
+            select(
+                new_profile.c.id,
+                literal(photo["data"], LargeBinary),
+                literal(photo["mime_type"]),
+                literal(photo["sha256"]),
+                literal(photo["size"]),
+            ),
+        ).cte("new_photo")
+        stmt = stmt.add_cte(new_photo)
+    return stmt
+
+
+def bulk_insert_statement(rows: list[dict]):
+    """Multi-row insert; returns (id, mobile_no) for each row actually created"""
+    return (
+        insert(profiles).values(rows)
+        .on_conflict_do_nothing(index_elements=[profiles.c.mobile_no])
+        .returning(profiles.c.id, profiles.c.mobile_no)
+    )
@@ -0,0 +1,177 @@
+"""
+Response compression middleware.
+
+Negotiates zstd, brotli or gzip from Accept-Encoding (zstd and brotli only
+when the zstandard/brotli packages are installed). Only allowlisted content
+types at or above the minimum size are compressed; images and other
+already-compressed bodies, ranged responses and pathsend file responses
+pass through untouched. Bodies sent in one piece are compressed in one
+call, streamed bodies chunk by chunk.
+"""
+
+import zlib
+
+try:
+    import brotli
+except ImportError:  # Optional; brotli is just not offered
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # Optional; zstd is just not offered
+    zstandard = None
+
+from starlette.datastructures import Headers, MutableHeaders
+
+
+class _Gzip:
+    def __init__(self, level: int):
+        self._obj = zlib.compressobj(level, zlib.DEFLATED, 31)  # 31 = gzip container
+
+    def compress(self, data: bytes) -> bytes:
+        return self._obj.compress(data)
+
+    def finish(self) -> bytes:
+        return self._obj.flush()
+
+
+class _Brotli:
+    def __init__(self, level: int):
+        self._obj = brotli.Compressor(quality=level)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._obj.process(data)
+
+    def finish(self) -> bytes:
+        return self._obj.finish()
+
+
+class _Zstd:
+    def __init__(self, level: int):
+        self._obj = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._obj.compress(data)
+
+    def finish(self) -> bytes:
+        return self._obj.flush()
+
+
+# Fast settings: the bodies are small JSON, so ratio gains past these levels
+# cost more CPU than they save on the wire
+_ENCODERS = {"gzip": (_Gzip, 6)}
+if brotli is not None:
+    _ENCODERS["br"] = (_Brotli, 4)
+if zstandard is not None:
+    _ENCODERS["zstd"] = (_Zstd, 3)
+
+
+def choose_encoding(accept_encoding: str | None, preferred: list[str]) -> str | None:
+    """First of preferred (that is installed) the client accepts with q > 0"""
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+    for encoding in preferred:
+        if encoding in _ENCODERS and accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = 1024, content_types: tuple = (), encodings: list[str] = ("gzip",)):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.content_types = tuple(content_types)
+        self.encodings = list(encodings)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding"), self.encodings)
+        if encoding is None:
+            return await self.app(scope, receive, send)
+        await _CompressedResponse(self, encoding, send)(scope, receive)
+
+    def compressible(self, headers: Headers) -> bool:
+        if "content-encoding" in headers:
+            return False
+        content_type = headers.get("content-type", "").split(";")[0].strip().lower()
+        return any(content_type == t or (t.endswith("/") and content_type.startswith(t)) for t in self.content_types)
+
+
+class _CompressedResponse:
+    """Per-request state: holds the response start until the first body
+    message shows whether compressing is worthwhile"""
+
+    def __init__(self, middleware: CompressionMiddleware, encoding: str, send):
+        self.middleware = middleware
+        self.encoding = encoding
+        self.send = send
+        self.start = None
+        self.compressor = None
+        self.passthrough = False
+
+    async def __call__(self, scope, receive):
+        await self.middleware.app(scope, receive, self.wrapped_send)
+
+    async def wrapped_send(self, message):
+        kind = message["type"]
+        if kind == "http.response.start":
+            headers = Headers(raw=message["headers"])
+            if message["status"] != 200 or not self.middleware.compressible(headers):
+                self.passthrough = True
+                await self.send(message)
+                return
+            # A list, so MutableHeaders below edits it in place
+            message["headers"] = list(message.get("headers", []))
+            self.start = message
+            return
+        if self.passthrough:
+            await self.send(message)
+            return
+
+        if kind != "http.response.body":
+            # e.g. pathsend: the server sends the file itself
+            self.passthrough = True
+            await self.send(self.start)
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        headers = MutableHeaders(raw=self.start["headers"])
+
+        if self.compressor is None:
+            if not more_body and len(body) < self.middleware.minimum_size:
+                headers.add_vary_header("Accept-Encoding")
+                self.passthrough = True
+                await self.send(self.start)
+                await self.send(message)
+                return
+            cls, level = _ENCODERS[self.encoding]
+            self.compressor = cls(level)
+            headers["Content-Encoding"] = self.encoding
+            headers.add_vary_header("Accept-Encoding")
+            if not more_body:
+                body = self.compressor.compress(body) + self.compressor.finish()
+                headers["Content-Length"] = str(len(body))
+                await self.send(self.start)
+                await self.send({"type": "http.response.body", "body": body})
+                return
+            del headers["Content-Length"]
+            await self.send(self.start)
+
+        chunk = self.compressor.compress(body)
+        if not more_body:
+            chunk += self.compressor.finish()
+        await self.send({"type": "http.response.body", "body": chunk, "more_body": more_body})
@@ -1,13 +1,123 @@
+from functools import lru_cache
 from pydantic_settings import BaseSettings
-from pydantic import Field
+from pydantic import AliasChoices, Field
+from typing import Literal
+import os
+
+# Scratch files shared by the workers on one host (SQLite OTP and rate-limit
+# stores, uploads being written); ignored by git
+DATA_TMP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "tmp")
+# Uploads and variants are written here, then renamed into uploads/: the
+# same filesystem, so the rename is atomic, but not served by /files/static
+UPLOAD_TMP_DIR = os.path.join(DATA_TMP_DIR, "uploads")
 
 
 class Settings(BaseSettings):
     database_url: str = Field(default="", alias="DATABASE_URL")
+    # Read replicas for read-only routes, comma-separated; empty reads from the primary
+    database_replica_urls: str = Field(
+        default="", validation_alias=AliasChoices("DATABASE_REPLICA_URLS", "DATABASE_REPLICA_URL")
+    )
+    # A user's reads stay on the primary this long after their own writes
+    # (and after logging in, which covers writes made through other workers)
+    replica_read_your_writes_seconds: float = Field(default=5, alias="REPLICA_READ_YOUR_WRITES_SECONDS")
+    # A replica that fails to connect is skipped this long
+    replica_retry_seconds: float = Field(default=30, alias="REPLICA_RETRY_SECONDS")
     jwt_secret: str = Field(default="change-me", alias="JWT_SECRET")
     jwt_algorithm: str = Field(default="HS256", alias="JWT_ALGORITHM")
     otp_expiry_seconds: int = Field(default=300, alias="OTP_EXPIRY_SECONDS")
+    # "sqlite" shares OTPs between uvicorn workers on the same host
+    otp_store_backend: Literal["memory", "sqlite"] = Field(default="memory", alias="OTP_STORE_BACKEND")
+    otp_store_max_entries: int = Field(default=100000, alias="OTP_STORE_MAX_ENTRIES")
+    otp_store_path: str = Field(default=os.path.join(DATA_TMP_DIR, "otp_store.sqlite3"), alias="OTP_STORE_PATH")
+    access_token_expire_minutes: int = Field(default=60 * 24 * 7, alias="ACCESS_TOKEN_EXPIRE_MINUTES")
+    # Verified-token cache; entries never outlive the token's own exp
+    token_cache_size: int = Field(default=10000, alias="TOKEN_CACHE_SIZE")
+    token_cache_ttl_seconds: int = Field(default=300, alias="TOKEN_CACHE_TTL_SECONDS")
+    upload_max_bytes: int = Field(default=10 * 1024 * 1024, alias="UPLOAD_MAX_BYTES")
+    # Per-worker cache of serialized /user/me responses
+    profile_cache_enabled: bool = Field(default=True, alias="PROFILE_CACHE_ENABLED")
+    profile_cache_ttl_seconds: int = Field(default=60, alias="PROFILE_CACHE_TTL_SECONDS")
+    profile_cache_max_entries: int = Field(default=10000, alias="PROFILE_CACHE_MAX_ENTRIES")
+    profile_cache_max_bytes: int = Field(default=32 * 1024 * 1024, alias="PROFILE_CACHE_MAX_BYTES")
+    # In-memory LRU for small files under /files/static
+    static_cache_max_bytes: int = Field(default=16 * 1024 * 1024, alias="STATIC_CACHE_MAX_BYTES")
+    static_cache_max_file_bytes: int = Field(default=64 * 1024, alias="STATIC_CACHE_MAX_FILE_BYTES")
+    # Background thumbnail/WebP variants (needs Pillow)
+    image_variants_enabled: bool = Field(default=True, alias="IMAGE_VARIANTS_ENABLED")
+    image_workers: int = Field(default=1, alias="IMAGE_WORKERS")
+    # Use SQLAlchemy's AsyncSession on psycopg's async driver instead of
+    # running the sync Session in the threadpool
+    db_async: bool = Field(default=False, alias="DB_ASYNC")
+    # Turn off when migrations run as a separate release step
+    run_migrations_on_startup: bool = Field(default=True, alias="RUN_MIGRATIONS_ON_STARTUP")
+    db_prewarm_connections: int = Field(default=5, alias="DB_PREWARM_CONNECTIONS")
+    # Per engine, per worker process
+    db_pool_size: int = Field(default=5, alias="DB_POOL_SIZE")
+    db_max_overflow: int = Field(default=10, alias="DB_MAX_OVERFLOW")
+    db_pool_timeout_seconds: float = Field(default=30, alias="DB_POOL_TIMEOUT_SECONDS")
+    db_pool_recycle_seconds: int = Field(default=300, alias="DB_POOL_RECYCLE_SECONDS")
+    # Checkout pings (SELECT 1) only connections idle at least this long;
+    # 0 pings on every checkout
+    db_pre_ping_idle_seconds: float = Field(default=30, alias="DB_PRE_PING_IDLE_SECONDS")
+    # Behind PgBouncer or Neon's "-pooler" host in transaction mode: no
+    # server-side prepared statements
+    db_pgbouncer: bool = Field(default=False, alias="DB_PGBOUNCER")
+    # Argon2 cost parameters; stored hashes using other values are rehashed on login
+    argon2_time_cost: int = Field(default=3, alias="ARGON2_TIME_COST")
+    argon2_memory_cost: int = Field(default=65536, alias="ARGON2_MEMORY_COST")  # KiB
+    argon2_parallelism: int = Field(default=4, alias="ARGON2_PARALLELISM")
+    # Password hashing process pool; 0 workers means one per CPU
+    password_hash_workers: int = Field(default=0, alias="PASSWORD_HASH_WORKERS")
+    password_hash_max_pending: int = Field(default=32, alias="PASSWORD_HASH_MAX_PENDING")
+    password_hash_retry_after: int = Field(default=1, alias="PASSWORD_HASH_RETRY_AFTER")
+    # /user/nearby starts at the initial radius and doubles up to the max
+    nearby_initial_radius_km: float = Field(default=2.0, alias="NEARBY_INITIAL_RADIUS_KM")
+    nearby_max_radius_km: float = Field(default=50.0, alias="NEARBY_MAX_RADIUS_KM")
+    # Logging goes through a queue to a background writer thread
+    log_level: str = Field(default="INFO", alias="LOG_LEVEL")
+    log_json: bool = Field(default=True, alias="LOG_JSON")
+    log_queue_size: int = Field(default=10000, alias="LOG_QUEUE_SIZE")
+    # Per-logger cap on DEBUG/INFO records per second; 0 disables
+    log_rate_limit_per_second: int = Field(default=100, alias="LOG_RATE_LIMIT_PER_SECOND")
+    # Gateway response compression; encodings in preference order, zstd/br
+    # only if their packages are installed. "text/" matches any text type.
+    compression_enabled: bool = Field(default=True, alias="COMPRESSION_ENABLED")
+    compression_min_size: int = Field(default=1024, alias="COMPRESSION_MIN_SIZE")
+    compression_encodings: str = Field(default="zstd,br,gzip", alias="COMPRESSION_ENCODINGS")
+    compression_content_types: str = Field(
+        default="application/json,text/,application/javascript,image/svg+xml", alias="COMPRESSION_CONTENT_TYPES"
+    )
+    # Token-bucket limits "N/seconds" on abuse-prone auth routes; "sqlite"
+    # shares buckets between workers on one host
+    rate_limit_enabled: bool = Field(default=True, alias="RATE_LIMIT_ENABLED")
+    rate_limit_backend: Literal["memory", "sqlite"] = Field(default="memory", alias="RATE_LIMIT_BACKEND")
+    rate_limit_path: str = Field(default=os.path.join(DATA_TMP_DIR, "rate_limit.sqlite3"), alias="RATE_LIMIT_PATH")
+    rate_limit_max_entries: int = Field(default=100000, alias="RATE_LIMIT_MAX_ENTRIES")
+    # Only behind proxies that append the client address to X-Forwarded-For
+    # (Render's does; render.yaml turns this on). Hops is how many of those
+    # proxies sit in front of us: the client is that many entries from the right.
+    rate_limit_trust_forwarded: bool = Field(default=False, alias="RATE_LIMIT_TRUST_FORWARDED")
+    rate_limit_forwarded_hops: int = Field(default=1, ge=1, alias="RATE_LIMIT_FORWARDED_HOPS")
+    rate_limit_send_otp_mobile: str = Field(default="3/600", alias="RATE_LIMIT_SEND_OTP_MOBILE")
+    rate_limit_send_otp_ip: str = Field(default="20/600", alias="RATE_LIMIT_SEND_OTP_IP")
+    rate_limit_login_mobile: str = Field(default="10/600", alias="RATE_LIMIT_LOGIN_MOBILE")
+    rate_limit_login_ip: str = Field(default="60/600", alias="RATE_LIMIT_LOGIN_IP")
+    # start.py / gunicorn.conf.py: worker processes (0 = one per available
+    # CPU), listen backlog, idle keep-alive, per-worker connection cap (503
+    # beyond it, 0 = none) and how long SIGTERM waits for in-flight requests
+    web_concurrency: int = Field(default=0, alias="WEB_CONCURRENCY")
+    web_backlog: int = Field(default=2048, alias="WEB_BACKLOG")
+    web_keepalive_seconds: int = Field(default=5, alias="WEB_KEEPALIVE_SECONDS")
+    web_limit_concurrency: int = Field(default=1000, alias="WEB_LIMIT_CONCURRENCY")
+    web_graceful_timeout_seconds: int = Field(default=20, alias="WEB_GRACEFUL_TIMEOUT_SECONDS")
 
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
+
+
+@lru_cache
+def get_settings() -> Settings:
+    """Process-wide settings, parsed from the environment and .env once"""
+    return Settings()
@@ -0,0 +1,42 @@
+"""
+CPU count as seen by this container.
+
+os.cpu_count() reports the host's CPUs; the affinity mask and the cgroup
+CPU quota (cgroup v2 cpu.max or v1 cfs quota) are what we can actually use.
+"""
+
+import math
+import os
+
+
+def _cgroup_quota() -> float | None:
+    """CPUs allowed by the cgroup quota, None when unlimited or unknown"""
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()[:2]
+        if quota != "max":
+            return int(quota) / int(period)
+        return None
+    except (OSError, ValueError):
+        pass
+    try:
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+            quota = int(f.read())
+        with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+            period = int(f.read())
+        if quota > 0 and period > 0:
+            return quota / period
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+def available_cpus() -> int:
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:  # Not on Linux
+        cpus = os.cpu_count() or 1
+    quota = _cgroup_quota()
+    if quota is not None:
+        cpus = min(cpus, math.ceil(quota))
+    return max(1, cpus)
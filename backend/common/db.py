@@ -1,58 +1,414 @@
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import DisconnectionError, TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
 from sqlalchemy.orm import sessionmaker, declarative_base
-from .config import Settings
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncEngine as AsyncEngineType
+from starlette.concurrency import run_in_threadpool
+from .config import get_settings
+from .metrics import Counter, Histogram, CallbackGauge, DB_BUCKETS
+from contextlib import ExitStack, AsyncExitStack, asynccontextmanager
+import asyncio
 import logging
 import os
+import threading
+import time
 
 Engine = None
 SessionLocal = sessionmaker(autocommit=False, autoflush=False)
+_engine_lock = threading.Lock()
 Base = declarative_base()
 
+# Async mode (Settings.db_async). Objects must stay usable after commit since
+# there is no implicit IO to refresh expired attributes.
+AsyncEngine = None
+AsyncSessionLocal = async_sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False)
+_async_engine_lock = asyncio.Lock()
+
+
+def _psycopg_url(database_url: str) -> str:
+    if database_url.startswith('postgresql+psycopg://'):
+        return database_url
+    if not database_url.startswith('postgresql://'):
+        raise ValueError("Invalid database URL format - must be postgresql://")
+    # Convert to psycopg3 driver for Python 3.13 compatibility
+    # Replace postgresql:// with postgresql+psycopg://
+    return database_url.replace('postgresql://', 'postgresql+psycopg://', 1)
+
+
+def libpq_url(database_url: str) -> str:
+    """database_url in the plain form psycopg.connect() takes, for scripts
+    that talk to psycopg directly (COPY, server-side cursors)"""
+    return _psycopg_url(database_url).replace('postgresql+psycopg://', 'postgresql://', 1)
+
+
+DB_QUERY_DURATION = Histogram("db_query_duration_seconds", "SQL statement execution time", ("engine",), DB_BUCKETS)
+DB_QUERY_ERRORS = Counter("db_query_errors_total", "SQL statements that raised", ("engine",))
+DB_POOL_CHECKOUT = Histogram(
+    "db_pool_checkout_seconds", "Time to get a connection from the pool, including connecting", ("engine",), DB_BUCKETS
+)
+DB_POOL_PINGS = Counter("db_pool_pings_total", "Checkout liveness pings of idle connections", ("engine", "result"))
+
+# Checkout waits per engine label; kept outside the pool since dispose() recreates it
+_pool_waits = {}
+
+
+def _waits(label: str) -> dict:
+    waits = _pool_waits.get(label)
+    if waits is None:
+        waits = _pool_waits[label] = {"checkouts": 0, "timeouts": 0, "wait_seconds_total": 0.0, "wait_seconds_max": 0.0}
+    return waits
+
+
+class _TimedPoolMixin:
+    engine_label = ""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        waits = _waits(self.engine_label)
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            waits["timeouts"] += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            waits["checkouts"] += 1
+            waits["wait_seconds_total"] += elapsed
+            if elapsed > waits["wait_seconds_max"]:
+                waits["wait_seconds_max"] = elapsed
+            DB_POOL_CHECKOUT.observe(elapsed, self.engine_label)
+
+
+class _TimedQueuePool(_TimedPoolMixin, QueuePool):
+    engine_label = "sync"
+
+
+class _TimedAsyncQueuePool(_TimedPoolMixin, AsyncAdaptedQueuePool):
+    engine_label = "async"
+
+
+def _instrument(engine, label: str):
+    """Record per-statement timings for engine (the sync engine behind an AsyncEngine for async)"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        DB_QUERY_DURATION.observe(time.perf_counter() - conn.info["query_started"].pop(), label)
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        started = context.connection.info.get("query_started") if context.connection is not None else None
+        if started:
+            started.pop()
+        DB_QUERY_ERRORS.inc(label)
+
+
+def _ping_idle_connections(engine, label: str, idle_seconds: float):
+    """Like pool_pre_ping, but only for connections that sat idle in the pool
+    for idle_seconds; ones in steady use skip the extra round trip"""
+
+    def _mark_idle(dbapi_connection, connection_record):
+        connection_record.info["idle_since"] = time.monotonic()
+
+    event.listen(engine, "connect", _mark_idle)
+    event.listen(engine, "checkin", _mark_idle)
+
+    @event.listens_for(engine, "checkout")
+    def _checkout(dbapi_connection, connection_record, connection_proxy):
+        idle_since = connection_record.info.get("idle_since")
+        if idle_since is None or time.monotonic() - idle_since < idle_seconds:
+            return
+        try:
+            engine.dialect.do_ping(dbapi_connection)
+        except Exception as e:
+            DB_POOL_PINGS.inc(label, "failed")
+            # The pool discards this connection and checks out another
+            raise DisconnectionError(f"Idle connection failed ping: {e}") from e
+        DB_POOL_PINGS.inc(label, "ok")
+
+
+def _engine_options(s) -> dict:
+    options = {
+        "echo": False,
+        "pool_size": s.db_pool_size,
+        "max_overflow": s.db_max_overflow,
+        "pool_timeout": s.db_pool_timeout_seconds,
+        "pool_recycle": s.db_pool_recycle_seconds,
+        "pool_pre_ping": s.db_pre_ping_idle_seconds <= 0,
+    }
+    if s.db_pgbouncer:
+        # A transaction pooler may run each transaction on a different server
+        # connection, where statements psycopg prepared earlier don't exist
+        options["connect_args"] = {"prepare_threshold": None}
+    return options
+
+
+def _configure_engine(engine, label: str, s):
+    _instrument(engine, label)
+    if s.db_pre_ping_idle_seconds > 0:
+        _ping_idle_connections(engine, label, s.db_pre_ping_idle_seconds)
+
+
+# Engines other than Engine/AsyncEngine (read replicas), by label; included
+# in pool_stats() and disposed with the primary
+_extra_engines = {}
+
+
+def create_pooled_engine(url: str, label: str, async_: bool = False, **overrides):
+    """Engine with the same pool settings and instrumentation as the primary,
+    reported under label; overrides replace individual engine options"""
+    s = get_settings()
+    options = {**_engine_options(s), **overrides}
+    base = _TimedAsyncQueuePool if async_ else _TimedQueuePool
+    # A class attribute, since dispose() recreates the pool from its class
+    poolclass = type(base.__name__, (base,), {"engine_label": label})
+    if async_:
+        engine = create_async_engine(_psycopg_url(url), poolclass=poolclass, **options)
+        _configure_engine(engine.sync_engine, label, s)
+    else:
+        engine = create_engine(_psycopg_url(url), poolclass=poolclass, **options)
+        _configure_engine(engine, label, s)
+    _extra_engines[label] = engine
+    return engine
+
+
+def _engines():
+    return [("sync", Engine), ("async", AsyncEngine), *_extra_engines.items()]
+
+
+def pool_stats() -> dict:
+    """Per engine: connections checked out, idle in the pool, open beyond
+    pool_size, and time spent waiting for a checkout"""
+    s = get_settings()
+    stats = {}
+    for label, engine in _engines():
+        pool = getattr(engine, "pool", None)
+        if pool is None:
+            continue
+        waits = _waits(label)
+        checkouts = waits["checkouts"]
+        stats[label] = {
+            "size": pool.size(),
+            "max_overflow": s.db_max_overflow,
+            "checked_out": pool.checkedout(),
+            "idle": pool.checkedin(),
+            "overflow": max(0, pool.overflow()),
+            "checkouts": checkouts,
+            "timeouts": waits["timeouts"],
+            "wait_ms_avg": round(waits["wait_seconds_total"] / checkouts * 1000, 3) if checkouts else 0.0,
+            "wait_ms_max": round(waits["wait_seconds_max"] * 1000, 3),
+        }
+    return stats
+
+
+def _pool_samples() -> dict:
+    samples = {}
+    for label, engine in _engines():
+        pool = getattr(engine, "pool", None)
+        if pool is None:
+            continue
+        samples[(label, "size")] = pool.size()
+        samples[(label, "checked_out")] = pool.checkedout()
+        samples[(label, "checked_in")] = pool.checkedin()
+        # Negative until the pool has opened pool_size connections
+        samples[(label, "overflow")] = pool.overflow()
+    return samples
+
+
+CallbackGauge("db_pool_connections", "Connection pool usage by state", ("engine", "state"), _pool_samples)
+
+
 def ensure_engine():
     global Engine
-    if Engine is None:
-        s = Settings()
+    if Engine is not None:
+        return
+    # /ready retries run init_database in the threadpool, possibly several
+    # at once; only one of them may build the engine and its pool
+    with _engine_lock:
+        if Engine is not None:
+            return
+        s = get_settings()
         if not s.database_url:
             raise RuntimeError("DATABASE_URL not configured")
-        
+
         try:
             # Force PostgreSQL connection using psycopg3
-            connection_string = s.database_url
-            if connection_string.startswith('postgresql://'):
-                # Convert to psycopg3 driver for Python 3.13 compatibility
-                # Replace postgresql:// with postgresql+psycopg://
-                psycopg3_connection_string = connection_string.replace('postgresql://', 'postgresql+psycopg://', 1)
-                
-                Engine = create_engine(
-                    psycopg3_connection_string,
-                    pool_pre_ping=True,
-                    pool_recycle=300,
-                    echo=False,
-                    pool_size=5,
-                    max_overflow=10
-                )
-                
-                # Test connection
-                with Engine.connect() as conn:
-                    result = conn.execute(text("SELECT 1"))
-                    result.fetchone()
-                
-                logging.info("PostgreSQL connection successful")
-                
-                # Create tables if they don't exist
-                Base.metadata.create_all(bind=Engine)
-                logging.info("Database tables ensured")
-                
-                # Run profile photo migration
-                from .migrations import run_profile_photo_migration
-                run_profile_photo_migration(SessionLocal())
-                
-            else:
-                raise ValueError("Invalid database URL format - must be postgresql://")
-                
+            psycopg3_connection_string = _psycopg_url(s.database_url)
+
+            engine = create_engine(psycopg3_connection_string, poolclass=_TimedQueuePool, **_engine_options(s))
+            _configure_engine(engine, "sync", s)
+
+            # Test connection
+            with engine.connect() as conn:
+                result = conn.execute(text("SELECT 1"))
+                result.fetchone()
+
+            logging.info("PostgreSQL connection successful")
+
         except Exception as e:
-            logging.error(f"PostgreSQL connection failed: {e}")
+            logging.error("PostgreSQL connection failed: %s", e)
             # Don't fallback to SQLite - we want to use Neon PostgreSQL
             raise RuntimeError(f"Failed to connect to PostgreSQL database: {e}")
-        
-        SessionLocal.configure(bind=Engine)
\ No newline at end of file
+
+        SessionLocal.configure(bind=engine)
+        # Published last, so the unlocked check above never sees a half-built engine
+        Engine = engine
+
+
+async def ensure_async_engine():
+    global AsyncEngine
+    if AsyncEngine is not None:
+        return
+    async with _async_engine_lock:
+        if AsyncEngine is not None:
+            return
+        if Engine is None:
+            # Scripts and background jobs still use the sync engine
+            await run_in_threadpool(ensure_engine)
+        s = get_settings()
+        AsyncEngine = create_async_engine(
+            _psycopg_url(s.database_url), poolclass=_TimedAsyncQueuePool, **_engine_options(s)
+        )
+        _configure_engine(AsyncEngine.sync_engine, "async", s)
+        AsyncSessionLocal.configure(bind=AsyncEngine)
+        logging.info("Async PostgreSQL engine ready")
+
+
+# Reported by /ready; set once startup has migrated and warmed the pool
+db_status = {"ready": False, "schema_version": None, "warm_connections": 0, "error": None}
+
+
+def _prewarm(engine, n: int):
+    # Hold n connections at once so the pool really opens n of them
+    with ExitStack() as stack:
+        for _ in range(n):
+            stack.enter_context(engine.connect())
+
+
+async def _prewarm_async(engine, n: int):
+    async with AsyncExitStack() as stack:
+        for _ in range(n):
+            await stack.enter_async_context(engine.connect())
+
+
+def _schema_version() -> int:
+    from .migrations import current_version
+    with Engine.connect() as conn:
+        return current_version(conn)
+
+
+async def init_database():
+    """Lifespan startup: create engines, apply migrations and prewarm pools,
+    so the first request on a fresh worker doesn't pay for any of it.
+    Failures are recorded rather than raised; /ready retries."""
+    s = get_settings()
+    try:
+        if Engine is None:
+            await run_in_threadpool(ensure_engine)
+        from .migrations import run_migrations, LATEST_VERSION
+        if s.run_migrations_on_startup:
+            version = await run_in_threadpool(run_migrations, Engine)
+        else:
+            version = await run_in_threadpool(_schema_version)
+        db_status["schema_version"] = version
+        if version < LATEST_VERSION:
+            # Routes would fail on the missing columns
+            raise RuntimeError(f"Schema at version {version} of {LATEST_VERSION}; run scripts/migrate.py")
+        warm = min(s.db_prewarm_connections, Engine.pool.size())
+        await run_in_threadpool(_prewarm, Engine, warm)
+        if s.db_async:
+            await ensure_async_engine()
+            await _prewarm_async(AsyncEngine, warm)
+        db_status.update(ready=True, warm_connections=warm, error=None)
+        logging.info("Database ready, %d connections warm", warm)
+    except Exception as e:
+        db_status.update(ready=False, error=str(e))
+        logging.error("Database startup failed: %s", e)
+
+
+async def dispose_database():
+    db_status["ready"] = False
+    for _, engine in _engines():
+        if isinstance(engine, AsyncEngineType):
+            await engine.dispose()
+        elif engine is not None:
+            engine.dispose()
+
+
+@asynccontextmanager
+async def database_lifespan():
+    await init_database()
+    try:
+        yield
+    finally:
+        await dispose_database()
+
+
+class ThreadpoolSession:
+    """AsyncSession-shaped wrapper that runs a sync Session in the threadpool.
+
+    Lets route handlers be written once against the async API while the sync
+    engine stays selectable for benchmarking.
+    """
+
+    def __init__(self, session):
+        self.sync_session = session
+
+    def add(self, obj):
+        self.sync_session.add(obj)
+
+    def add_all(self, objs):
+        self.sync_session.add_all(objs)
+
+    async def execute(self, *args, **kwargs):
+        return await run_in_threadpool(self.sync_session.execute, *args, **kwargs)
+
+    async def scalar(self, *args, **kwargs):
+        return await run_in_threadpool(self.sync_session.scalar, *args, **kwargs)
+
+    async def scalars(self, *args, **kwargs):
+        return await run_in_threadpool(self.sync_session.scalars, *args, **kwargs)
+
+    async def get(self, *args, **kwargs):
+        return await run_in_threadpool(self.sync_session.get, *args, **kwargs)
+
+    async def flush(self, *args, **kwargs):
+        await run_in_threadpool(self.sync_session.flush, *args, **kwargs)
+
+    async def refresh(self, *args, **kwargs):
+        await run_in_threadpool(self.sync_session.refresh, *args, **kwargs)
+
+    async def commit(self):
+        await run_in_threadpool(self.sync_session.commit)
+
+    async def rollback(self):
+        await run_in_threadpool(self.sync_session.rollback)
+
+    async def close(self):
+        await run_in_threadpool(self.sync_session.close)
+
+    async def run_sync(self, fn, *args, **kwargs):
+        return await run_in_threadpool(fn, self.sync_session, *args, **kwargs)
+
+
+async def open_session():
+    """A new session on the primary: an AsyncSession, or a threadpool-backed
+    sync Session when Settings.db_async is off. The caller closes it."""
+    if get_settings().db_async:
+        await ensure_async_engine()
+        return AsyncSessionLocal()
+    if Engine is None:
+        await run_in_threadpool(ensure_engine)
+    return ThreadpoolSession(SessionLocal(expire_on_commit=False))
+
+
+async def get_db():
+    """FastAPI dependency yielding a session on the primary (see open_session)"""
+    db = await open_session()
+    try:
+        yield db
+    finally:
+        await db.close()
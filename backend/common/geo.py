@@ -0,0 +1,71 @@
+"""
+Grid index and distance helpers for nearby search.
+
+user_profiles.geo_cell, kept current by a trigger, numbers the 0.1 degree
+grid cell a profile's coordinates fall in. A search covers its bounding box with
+cells, filters candidates on (category, geo_cell) plus the box, then ranks
+them by exact haversine distance with NumPy.
+
+Boxes are clamped at the poles and the antimeridian rather than wrapped.
+"""
+
+import math
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+CELLS_PER_DEGREE = 10
+# Keeps lat/lon cell numbers apart; |lon cell| never exceeds 1800
+_LAT_STRIDE = 4000
+
+
+def geo_cell_sql(lat: str = "latitude", lon: str = "longitude") -> str:
+    """SQL for the cell of the lat/lon expressions; must match cell_of()
+    exactly (numeric floor in Postgres, float floor here)"""
+    return (
+        f"(floor({lat} * {CELLS_PER_DEGREE})::integer * {_LAT_STRIDE}"
+        f" + floor({lon} * {CELLS_PER_DEGREE})::integer)"
+    )
+
+
+GEO_CELL_SQL = geo_cell_sql()
+
+# Past this many cells a plain box scan is cheaper than a huge IN list
+MAX_COVER_CELLS = 400
+
+
+def cell_of(lat: float, lon: float) -> int:
+    return math.floor(lat * CELLS_PER_DEGREE) * _LAT_STRIDE + math.floor(lon * CELLS_PER_DEGREE)
+
+
+def bounding_box(lat: float, lon: float, radius_km: float) -> tuple[float, float, float, float]:
+    """(min_lat, max_lat, min_lon, max_lon) enclosing the circle"""
+    dlat = radius_km / KM_PER_DEGREE
+    min_lat, max_lat = max(lat - dlat, -90.0), min(lat + dlat, 90.0)
+    # Widest point of the circle is at the latitude nearest a pole
+    cos_lat = math.cos(math.radians(max(abs(min_lat), abs(max_lat))))
+    dlon = 180.0 if cos_lat < 1e-9 else min(dlat / cos_lat, 180.0)
+    return min_lat, max_lat, max(lon - dlon, -180.0), min(lon + dlon, 180.0)
+
+
+def cover_cells(box: tuple[float, float, float, float]) -> list[int] | None:
+    """Grid cells overlapping the box, or None if there are too many to be useful"""
+    min_lat, max_lat, min_lon, max_lon = box
+    lat_lo, lat_hi = math.floor(min_lat * CELLS_PER_DEGREE), math.floor(max_lat * CELLS_PER_DEGREE)
+    lon_lo, lon_hi = math.floor(min_lon * CELLS_PER_DEGREE), math.floor(max_lon * CELLS_PER_DEGREE)
+    if (lat_hi - lat_lo + 1) * (lon_hi - lon_lo + 1) > MAX_COVER_CELLS:
+        return None
+    return [
+        lat_cell * _LAT_STRIDE + lon_cell
+        for lat_cell in range(lat_lo, lat_hi + 1)
+        for lon_cell in range(lon_lo, lon_hi + 1)
+    ]
+
+
+def haversine_km(lat: float, lon: float, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """Great-circle distance from one point to arrays of points"""
+    lat1, lon1 = math.radians(lat), math.radians(lon)
+    lat2, lon2 = np.radians(lats), np.radians(lons)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
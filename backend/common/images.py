@@ -0,0 +1,175 @@
+"""
+Resized image variants for avatars and uploads.
+
+Originals are kept as uploaded; a background job decodes each image once and
+writes fixed-size WebP/JPEG variants that clients can request with ?size=.
+Until the job finishes (or if Pillow is missing) the original is served.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from sqlalchemy import delete
+from starlette.concurrency import run_in_threadpool
+import asyncio
+import logging
+import os
+import tempfile
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional; variants are simply not produced
+    Image = None
+
+from .config import get_settings, UPLOAD_TMP_DIR
+from .db import SessionLocal
+from .models import UserProfilePhotoVariant
+
+
+# Types accepted for profile photos, and anything else is served as a download
+PHOTO_MIME_TYPES = ("image/jpeg", "image/png", "image/webp")
+
+VARIANT_SIZES = (64, 256, 1024)
+VARIANT_FORMATS = {"webp": "image/webp", "jpeg": "image/jpeg"}
+_QUALITY = {"webp": 80, "jpeg": 85}
+
+
+def sniff_image_type(data: bytes) -> str | None:
+    """MIME type from the file signature, for the formats in PHOTO_MIME_TYPES"""
+    if data.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+def variants_available() -> bool:
+    return Image is not None and get_settings().image_variants_enabled
+
+
+def pick_variant_size(requested: int) -> int | None:
+    """Smallest variant at least as large as requested, None for the original"""
+    for size in VARIANT_SIZES:
+        if size >= requested:
+            return size
+    return None
+
+
+def negotiate_format(requested: str | None, accept: str | None) -> str:
+    if requested in VARIANT_FORMATS:
+        return requested
+    if accept and "image/webp" in accept:
+        return "webp"
+    return "jpeg"
+
+
+def variant_name(name: str, size: int, fmt: str) -> str:
+    """uploads/<sha>.jpg -> uploads/<sha>.256.webp"""
+    return f"{os.path.splitext(name)[0]}.{size}.{fmt}"
+
+
+def render_variants(data) -> dict[tuple[int, str], bytes]:
+    """Decode once and encode every (size, format) variant. Runs in a worker process."""
+    img = Image.open(BytesIO(data) if isinstance(data, bytes) else data)
+    # JPEG can decode straight at a reduced scale, much cheaper than full size
+    img.draft("RGB", (VARIANT_SIZES[-1], VARIANT_SIZES[-1]))
+    img = ImageOps.exif_transpose(img)
+    has_alpha = img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info)
+    img = img.convert("RGBA" if has_alpha else "RGB")
+
+    out = {}
+    # Largest first, each step shrinking the previous result
+    current = img
+    for size in sorted(VARIANT_SIZES, reverse=True):
+        current = current.copy()
+        current.thumbnail((size, size), Image.LANCZOS)
+        for fmt in VARIANT_FORMATS:
+            frame = current.convert("RGB") if fmt == "jpeg" and has_alpha else current
+            buf = BytesIO()
+            frame.save(buf, format=fmt.upper(), quality=_QUALITY[fmt], optimize=fmt == "jpeg")
+            out[(size, fmt)] = buf.getvalue()
+    return out
+
+
+def write_variant_files(path: str) -> int:
+    """Render variants of an uploaded file next to it. Runs in a worker process."""
+    variants = render_variants(path)
+    os.makedirs(UPLOAD_TMP_DIR, exist_ok=True)
+    for (size, fmt), encoded in variants.items():
+        target = variant_name(path, size, fmt)
+        fd, tmp = tempfile.mkstemp(dir=UPLOAD_TMP_DIR, suffix=".part")
+        with os.fdopen(fd, "wb") as f:
+            f.write(encoded)
+        os.replace(tmp, target)
+    return len(variants)
+
+
+class ImageVariantPool:
+    """Process pool for variant rendering, kept apart from request handling"""
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self._pool = None
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    async def _run(self, fn, arg):
+        if not variants_available():
+            return None
+        loop = asyncio.get_running_loop()
+        pool = self._get_pool()
+        try:
+            return await loop.run_in_executor(pool, fn, arg)
+        except BrokenProcessPool as e:
+            # A Pillow worker died and took the pool with it; start afresh
+            # on the next call rather than failing every upload from now on
+            logging.warning("Image variant pool broke, replacing it: %s", e)
+            if self._pool is pool:
+                pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+            return None
+        except Exception as e:
+            logging.warning("Image variant rendering failed: %s", e)
+            return None
+
+    async def render(self, data: bytes) -> dict[tuple[int, str], bytes] | None:
+        return await self._run(render_variants, data)
+
+    async def render_files(self, path: str) -> int | None:
+        return await self._run(write_variant_files, path)
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+image_pool = ImageVariantPool(get_settings().image_workers)
+
+
+def _store_profile_photo_variants(user_id, source_sha256: str, variants: dict):
+    db = SessionLocal()
+    try:
+        db.execute(delete(UserProfilePhotoVariant).where(UserProfilePhotoVariant.user_id == user_id))
+        db.add_all(
+            UserProfilePhotoVariant(user_id=user_id, size=size, format=fmt, source_sha256=source_sha256, data=encoded)
+            for (size, fmt), encoded in variants.items()
+        )
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logging.warning("Storing photo variants failed for user %s: %s", user_id, e)
+    finally:
+        db.close()
+
+
+async def generate_profile_photo_variants(user_id, source_sha256: str, data: bytes):
+    """Background task: render a profile photo's variants and store them"""
+    variants = await image_pool.render(data)
+    if variants:
+        await run_in_threadpool(_store_profile_photo_variants, user_id, source_sha256, variants)
@@ -0,0 +1,194 @@
+"""
+Queue-based logging.
+
+configure_logging() puts a single QueueHandler on the root logger (and on
+uvicorn's loggers); a QueueListener thread formats records and writes them
+to stderr, so request handlers never block on the log pipe. Records are
+formatted on the listener thread, so pass values as %-style args rather
+than f-strings. Each record carries the request id set by
+RequestIdMiddleware, and DEBUG/INFO chatter is rate limited per logger.
+
+The listener thread does not survive fork, so a process forked after
+configure_logging() (gunicorn preload_app workers) starts its own.
+"""
+
+from contextvars import ContextVar
+import atexit
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+import uuid
+from .config import get_settings
+
+request_id_var: ContextVar[str | None] = ContextVar("request_id", default=None)
+
+_listener = None
+_handler = None
+UVICORN_LOGGERS = ("uvicorn", "uvicorn.error", "uvicorn.access")
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            entry["request_id"] = request_id
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            entry["suppressed"] = suppressed
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class RateLimitFilter(logging.Filter):
+    """Lets through at most `per_second` records below WARNING per logger.
+
+    The first record after a throttled second reports how many were dropped
+    in its `suppressed` field.
+    """
+
+    def __init__(self, per_second: int):
+        super().__init__()
+        self.per_second = per_second
+        self._windows: dict[str, list] = {}  # logger -> [window start, passed, dropped]
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.per_second <= 0 or record.levelno >= logging.WARNING:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            window = self._windows.get(record.name)
+            if window is None or now - window[0] >= 1.0:
+                dropped = window[2] if window else 0
+                window = self._windows[record.name] = [now, 0, 0]
+                if dropped:
+                    record.suppressed = dropped
+            if window[1] >= self.per_second:
+                window[2] += 1
+                return False
+            window[1] += 1
+            return True
+
+
+class AsyncQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that stamps the request id and defers formatting to the listener.
+
+    When the queue is full the record is dropped (and counted) rather than
+    blocking or printing an error on the request path.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Same process, so the record needn't be made picklable; message
+        # merging happens in the listener thread
+        record.request_id = request_id_var.get()
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def configure_logging():
+    """Install the queue handler; safe to call more than once"""
+    global _listener, _handler
+    if _listener is not None:
+        return
+    s = get_settings()
+
+    stream = logging.StreamHandler(sys.stderr)
+    if s.log_json:
+        stream.setFormatter(JsonFormatter())
+    else:
+        stream.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s"))
+
+    _handler = AsyncQueueHandler(queue.Queue(maxsize=s.log_queue_size))
+    _handler.addFilter(RateLimitFilter(s.log_rate_limit_per_second))
+
+    root = logging.getLogger()
+    root.handlers = [_handler]
+    root.setLevel(s.log_level.upper())
+    attach_uvicorn_loggers()
+
+    _listener = logging.handlers.QueueListener(_handler.queue, stream, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_stop_listener)
+
+
+def attach_uvicorn_loggers():
+    """uvicorn (and gunicorn's uvicorn worker) install their own synchronous
+    handlers; route those loggers through the queue instead"""
+    if _handler is None:
+        return
+    for name in UVICORN_LOGGERS:
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers = [_handler]
+        uvicorn_logger.propagate = False
+
+
+def _stop_listener():
+    if _listener is not None:
+        _listener.stop()
+
+
+def _restart_listener_after_fork():
+    global _listener
+    if _listener is None:
+        return
+    # Fresh queue: the parent's may have been locked mid-put when it forked
+    _handler.queue = queue.Queue(maxsize=_handler.queue.maxsize)
+    _listener = logging.handlers.QueueListener(_handler.queue, *_listener.handlers, respect_handler_level=True)
+    _listener.start()
+
+
+os.register_at_fork(after_in_child=_restart_listener_after_fork)
+
+
+class RequestIdMiddleware:
+    """Takes X-Request-ID from the client (or makes one), exposes it to log
+    records through request_id_var and echoes it on the response."""
+
+    header = b"x-request-id"
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == self.header:
+                request_id = value.decode("latin-1")[:64]
+                break
+        request_id = request_id or uuid.uuid4().hex
+        token = request_id_var.set(request_id)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), (self.header, request_id.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            request_id_var.reset(token)
@@ -1,46 +1,183 @@
 """
-Auto-migration for profile photo columns.
-This runs automatically when the backend starts to ensure database schema is up to date.
+Versioned schema migrations.
+
+Applied versions are recorded in schema_migrations. run_migrations() takes a
+Postgres advisory lock, so when several workers start at once only the first
+applies pending steps and the rest just read the current version. Every step
+must be idempotent (IF NOT EXISTS, checkfirst) so a database that predates
+this table can be brought under it safely, and each commits on its own.
+
+Steps marked @online are too slow to run inside a worker's startup (table
+backfills, CREATE INDEX CONCURRENTLY). They get the engine rather than a
+transaction, must be resumable after being interrupted, and only
+scripts/migrate.py applies them; startup stops at the first one.
+
+Add new steps to the end of MIGRATIONS; never renumber or edit applied ones.
 """
 
 from sqlalchemy import text
+from .db import Base
+from .geo import GEO_CELL_SQL, geo_cell_sql
+from . import models  # noqa: F401 - registers every table on Base.metadata
 import logging
 
-def run_profile_photo_migration(db_session):
-    """Automatically add profile photo columns if they don't exist"""
-    
-    try:
-        # Check if columns exist
-        check_sql = """
-        SELECT column_name 
-        FROM information_schema.columns 
-        WHERE table_name = 'user_profiles' 
-        AND column_name IN ('profile_photo_data', 'profile_photo_mime_type');
-        """
-        
-        result = db_session.execute(text(check_sql))
-        existing_columns = {row[0] for row in result.fetchall()}
-        
-        missing_columns = []
-        if 'profile_photo_data' not in existing_columns:
-            missing_columns.append('profile_photo_data TEXT')
-        if 'profile_photo_mime_type' not in existing_columns:
-            missing_columns.append('profile_photo_mime_type VARCHAR(50)')
-        
-        if missing_columns:
-            logging.info(f"Adding missing profile photo columns: {missing_columns}")
-            
-            # Add missing columns
-            for column_def in missing_columns:
-                alter_sql = f"ALTER TABLE user_profiles ADD COLUMN IF NOT EXISTS {column_def};"
-                db_session.execute(text(alter_sql))
-            
-            db_session.commit()
-            logging.info("✅ Profile photo migration completed successfully!")
+# Arbitrary application-wide key for pg_advisory_lock
+_LOCK_KEY = 0x5348414B41
+
+# Rows per backfill transaction, so no batch holds row locks for long
+_BACKFILL_BATCH = 5000
+
+
+def online(step):
+    step.online = True
+    return step
+
+
+def _create_index_concurrently(engine, name: str, definition: str):
+    """CREATE INDEX CONCURRENTLY name ON definition, rebuilding it if an
+    interrupted earlier attempt left it invalid"""
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        valid = conn.execute(
+            text("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:name)"), {"name": name}
+        ).scalar()
+        if valid:
+            return
+        if valid is not None:
+            logging.info("Rebuilding invalid index %s", name)
+            conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+        conn.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {definition}"))
+
+
+def _create_tables(conn):
+    Base.metadata.create_all(bind=conn)
+
+
+def _profile_photo_columns(conn):
+    conn.execute(text(
+        "ALTER TABLE user_profiles "
+        "ADD COLUMN IF NOT EXISTS profile_photo_data TEXT, "
+        "ADD COLUMN IF NOT EXISTS profile_photo_mime_type VARCHAR(50)"
+    ))
+
+
+@online
+def _geo_cell_index(engine):
+    # A plain column kept current by a trigger: a stored generated column
+    # would rewrite the whole table under ACCESS EXCLUSIVE. The trigger
+    # covers every write path, COPY included.
+    with engine.begin() as conn:
+        # Queue behind long transactions briefly, not indefinitely
+        conn.execute(text("SET LOCAL lock_timeout = '5s'"))
+        conn.execute(text("ALTER TABLE user_profiles ADD COLUMN IF NOT EXISTS geo_cell INTEGER"))
+        conn.execute(text(
+            "CREATE OR REPLACE FUNCTION user_profiles_geo_cell() RETURNS trigger AS $$ "
+            f"BEGIN NEW.geo_cell := {geo_cell_sql('NEW.latitude', 'NEW.longitude')}; RETURN NEW; END "
+            "$$ LANGUAGE plpgsql"
+        ))
+        conn.execute(text("DROP TRIGGER IF EXISTS user_profiles_geo_cell ON user_profiles"))
+        conn.execute(text(
+            "CREATE TRIGGER user_profiles_geo_cell "
+            "BEFORE INSERT OR UPDATE OF latitude, longitude ON user_profiles "
+            "FOR EACH ROW EXECUTE FUNCTION user_profiles_geo_cell()"
+        ))
+    # Rows written from here on get their cell from the trigger
+    filled = 0
+    while True:
+        with engine.begin() as conn:
+            count = conn.execute(text(
+                f"UPDATE user_profiles SET geo_cell = {GEO_CELL_SQL} WHERE id IN ("
+                "SELECT id FROM user_profiles "
+                "WHERE geo_cell IS NULL AND latitude IS NOT NULL AND longitude IS NOT NULL "
+                "LIMIT :batch)"
+            ), {"batch": _BACKFILL_BATCH}).rowcount
+        if not count:
+            break
+        filled += count
+        logging.info("Backfilled geo_cell for %d profiles", filled)
+    _create_index_concurrently(engine, "ix_user_profiles_category_geo_cell", "user_profiles (category, geo_cell)")
+
+
+@online
+def _directory_indexes(engine):
+    for name, columns in (
+        ("ix_user_profiles_directory", "category, full_name, id"),
+        ("ix_user_profiles_directory_city", "category, city, full_name, id"),
+        ("ix_user_profiles_directory_state", "category, state, full_name, id"),
+        ("ix_user_profiles_directory_pincode", "category, pincode, full_name, id"),
+    ):
+        _create_index_concurrently(engine, name, f"user_profiles ({columns})")
+
+
+MIGRATIONS = [
+    (1, "create tables", _create_tables),
+    (2, "profile photo columns", _profile_photo_columns),
+    (3, "geo cell index", _geo_cell_index),
+    (4, "directory indexes", _directory_indexes),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(conn) -> int:
+    exists = conn.execute(text("SELECT to_regclass('schema_migrations')")).scalar()
+    if exists is None:
+        return 0
+    return conn.execute(text("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")).scalar()
+
+
+def run_migrations(engine, include_online: bool = False) -> int:
+    """Apply pending migrations; returns the schema version afterwards.
+    Without include_online it stops before the first online step."""
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as lock_conn:
+        if include_online:
+            lock_conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": _LOCK_KEY})
+        elif not lock_conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": _LOCK_KEY}).scalar():
+            # Someone else is migrating. Waiting on the lock here would also
+            # hold up their CREATE INDEX CONCURRENTLY, which waits for us.
+            version = current_version(lock_conn)
+            logging.info("Migrations are running elsewhere; schema at version %d", version)
+            return version
+        try:
+            return _apply_pending(engine, include_online)
+        finally:
+            lock_conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": _LOCK_KEY})
+
+
+def _apply_pending(engine, include_online: bool) -> int:
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            "version INTEGER PRIMARY KEY, "
+            "description TEXT NOT NULL, "
+            "applied_at TIMESTAMP NOT NULL DEFAULT NOW())"
+        ))
+        version = current_version(conn)
+    if version >= LATEST_VERSION:
+        logging.info("Schema at version %d, nothing to migrate", version)
+        return version
+    for number, description, step in MIGRATIONS:
+        if number <= version:
+            continue
+        if getattr(step, "online", False):
+            if not include_online:
+                logging.warning("Migration %d (%s) runs online; apply it with scripts/migrate.py", number, description)
+                return version
+            logging.info("Applying online migration %d: %s", number, description)
+            step(engine)
+            with engine.begin() as conn:
+                _record(conn, number, description)
         else:
-            logging.info("Profile photo columns already exist, skipping migration")
-            
-    except Exception as e:
-        logging.error(f"Profile photo migration failed: {e}")
-        db_session.rollback()
-        # Don't raise exception - let the app continue
\ No newline at end of file
+            logging.info("Applying migration %d: %s", number, description)
+            with engine.begin() as conn:
+                step(conn)
+                _record(conn, number, description)
+        version = number
+    logging.info("✅ Schema migrated to version %d", version)
+    return version
+
+
+def _record(conn, number: int, description: str):
+    conn.execute(
+        text("INSERT INTO schema_migrations (version, description) VALUES (:v, :d)"),
+        {"v": number, "d": description},
+    )
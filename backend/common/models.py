@@ -1,7 +1,16 @@
-from sqlalchemy import Column, String, Text, TIMESTAMP, Numeric, text
+from sqlalchemy import Column, String, Text, TIMESTAMP, Numeric, Integer, LargeBinary, ForeignKey, FetchedValue, Index, text
 from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import deferred
 from .db import Base
-import base64
+
+
+# Hex digits of the photo's sha256 in its versioned URL
+PHOTO_VERSION_LENGTH = 16
+
+
+def profile_photo_path(user_id, digest: str) -> str:
+    """Short, versioned URL served by /user/{id}/photo"""
+    return f"/user/{user_id}/photo?v={digest[:PHOTO_VERSION_LENGTH]}"
 
 
 class UserProfile(Base):
@@ -9,7 +18,8 @@ class UserProfile(Base):
     id = Column(UUID(as_uuid=True), primary_key=True, server_default=text("gen_random_uuid()"))
     full_name = Column(String(255), nullable=False)
     mobile_no = Column(String(20), nullable=False, unique=True)
-    password = Column(Text, nullable=False)
+    # Heavy or sensitive columns load only when accessed or undefer()ed
+    password = deferred(Column(Text, nullable=False))
     gender = Column(String(20))
     category = Column(String(50), nullable=False)
     address_line = Column(Text)
@@ -19,20 +29,47 @@ class UserProfile(Base):
     pincode = Column(String(20))
     latitude = Column(Numeric(10, 7))
     longitude = Column(Numeric(10, 7))
+    # Grid cell for nearby search, set by the user_profiles_geo_cell trigger (migration 3)
+    geo_cell = Column(Integer, server_default=FetchedValue(), server_onupdate=FetchedValue())
     profile_photo_url = Column(Text)
-    profile_photo_data = Column(Text)  # Base64 encoded image data
+    profile_photo_data = deferred(Column(Text))  # Legacy base64 image data, superseded by user_profile_photos
     profile_photo_mime_type = Column(String(50))  # e.g., 'image/jpeg', 'image/png'
     created_at = Column(TIMESTAMP, server_default=text("NOW()"))
     updated_at = Column(TIMESTAMP, server_default=text("NOW()"))
 
-    def set_profile_photo(self, image_data: bytes, mime_type: str):
-        """Store profile photo as base64 in database"""
-        self.profile_photo_data = base64.b64encode(image_data).decode('utf-8')
-        self.profile_photo_mime_type = mime_type
-        self.profile_photo_url = f"data:{mime_type};base64,{self.profile_photo_data}"
-
-    def get_profile_photo_data(self) -> bytes:
-        """Get profile photo data as bytes"""
-        if self.profile_photo_data:
-            return base64.b64decode(self.profile_photo_data)
-        return None
+    __table_args__ = (
+        Index("ix_user_profiles_category_geo_cell", "category", "geo_cell"),
+        # /user/directory: equality filters, then the (full_name, id) page key.
+        # Ordered range scans rather than index-only ones: the rest of each
+        # card comes from the heap, for at most limit + 1 rows per category
+        Index("ix_user_profiles_directory", "category", "full_name", "id"),
+        Index("ix_user_profiles_directory_city", "category", "city", "full_name", "id"),
+        Index("ix_user_profiles_directory_state", "category", "state", "full_name", "id"),
+        Index("ix_user_profiles_directory_pincode", "category", "pincode", "full_name", "id"),
+    )
+
+    def public_photo_url(self) -> str | None:
+        """Photo URL safe to hand to clients (never an inline data: URI)"""
+        url = self.profile_photo_url
+        if url and url.startswith("data:"):
+            return f"/user/{self.id}/photo"
+        return url
+
+
+class UserProfilePhoto(Base):
+    __tablename__ = "user_profile_photos"
+    user_id = Column(UUID(as_uuid=True), ForeignKey("user_profiles.id", ondelete="CASCADE"), primary_key=True)
+    data = deferred(Column(LargeBinary, nullable=False))
+    mime_type = Column(String(50), nullable=False)
+    sha256 = Column(String(64), nullable=False)
+    size = Column(Integer, nullable=False)
+    updated_at = Column(TIMESTAMP, server_default=text("NOW()"), onupdate=text("NOW()"))
+
+
+class UserProfilePhotoVariant(Base):
+    __tablename__ = "user_profile_photo_variants"
+    user_id = Column(UUID(as_uuid=True), ForeignKey("user_profile_photos.user_id", ondelete="CASCADE"), primary_key=True)
+    size = Column(Integer, primary_key=True)
+    format = Column(String(10), primary_key=True)
+    source_sha256 = Column(String(64), nullable=False)  # Original the variant was rendered from
+    data = Column(LargeBinary, nullable=False)
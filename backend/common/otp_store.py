@@ -0,0 +1,128 @@
+"""
+OTP storage backends.
+
+"memory" keeps codes in-process (single worker only); "sqlite" keeps them in a
+WAL-mode SQLite file so every uvicorn worker on the host sees the same codes.
+"""
+
+from abc import ABC, abstractmethod
+from starlette.concurrency import run_in_threadpool
+from .config import Settings
+from .sqlite_store import SqliteStore
+import heapq
+import time
+
+
+class OtpStore(ABC):
+    """Interface: codes are stored per mobile number with an absolute expiry"""
+
+    @abstractmethod
+    async def put(self, mobile_no: str, code: str, ttl_seconds: int):
+        ...
+
+    @abstractmethod
+    async def get(self, mobile_no: str) -> tuple[str, float] | None:
+        """Return (code, expiry) or None. Expired entries may still be returned."""
+
+    @abstractmethod
+    async def delete(self, mobile_no: str):
+        ...
+
+
+class MemoryOtpStore(OtpStore):
+    """Size-capped dict with a heap of expiries for cheap sweeping"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._codes: dict[str, tuple[str, float]] = {}
+        self._expiries: list[tuple[float, str]] = []
+
+    def _sweep(self, now: float):
+        while self._expiries and self._expiries[0][0] <= now:
+            expiry, mobile_no = heapq.heappop(self._expiries)
+            entry = self._codes.get(mobile_no)
+            # Heap entries go stale when a number is re-sent a new code
+            if entry is not None and entry[1] == expiry:
+                del self._codes[mobile_no]
+
+    def _compact(self):
+        self._expiries = [(exp, m) for m, (_, exp) in self._codes.items()]
+        heapq.heapify(self._expiries)
+
+    async def put(self, mobile_no: str, code: str, ttl_seconds: int):
+        now = time.time()
+        self._sweep(now)
+        expiry = now + ttl_seconds
+        self._codes[mobile_no] = (code, expiry)
+        heapq.heappush(self._expiries, (expiry, mobile_no))
+        if len(self._expiries) > 2 * len(self._codes) + 64:
+            self._compact()
+        # Over the cap: drop the codes closest to expiring
+        while len(self._codes) > self.max_entries:
+            expiry, victim = heapq.heappop(self._expiries)
+            entry = self._codes.get(victim)
+            if entry is not None and entry[1] == expiry:
+                del self._codes[victim]
+
+    async def get(self, mobile_no: str) -> tuple[str, float] | None:
+        return self._codes.get(mobile_no)
+
+    async def delete(self, mobile_no: str):
+        self._codes.pop(mobile_no, None)
+
+    def __len__(self):
+        return len(self._codes)
+
+
+class SqliteOtpStore(SqliteStore, OtpStore):
+    """Shared across worker processes on one host via a WAL-mode SQLite file"""
+
+    SWEEP_EVERY = 100
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self._puts = 0
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS otp_codes ("
+            "mobile_no TEXT PRIMARY KEY, code TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_otp_codes_expires_at ON otp_codes (expires_at)")
+
+    def _put(self, mobile_no: str, code: str, expiry: float, sweep: bool):
+        conn = self._conn()
+        conn.execute(
+            "INSERT INTO otp_codes (mobile_no, code, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT (mobile_no) DO UPDATE SET code = excluded.code, expires_at = excluded.expires_at",
+            (mobile_no, code, expiry),
+        )
+        if sweep:
+            conn.execute("DELETE FROM otp_codes WHERE expires_at <= ?", (time.time(),))
+
+    def _get(self, mobile_no: str):
+        row = self._conn().execute(
+            "SELECT code, expires_at FROM otp_codes WHERE mobile_no = ?", (mobile_no,)
+        ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def _delete(self, mobile_no: str):
+        self._conn().execute("DELETE FROM otp_codes WHERE mobile_no = ?", (mobile_no,))
+
+    async def put(self, mobile_no: str, code: str, ttl_seconds: int):
+        self._puts += 1
+        sweep = self._puts % self.SWEEP_EVERY == 0
+        await run_in_threadpool(self._put, mobile_no, code, time.time() + ttl_seconds, sweep)
+
+    async def get(self, mobile_no: str) -> tuple[str, float] | None:
+        return await run_in_threadpool(self._get, mobile_no)
+
+    async def delete(self, mobile_no: str):
+        await run_in_threadpool(self._delete, mobile_no)
+
+
+def create_otp_store(s: Settings) -> OtpStore:
+    if s.otp_store_backend == "memory":
+        return MemoryOtpStore(s.otp_store_max_entries)
+    if s.otp_store_backend == "sqlite":
+        return SqliteOtpStore(s.otp_store_path)
+    raise ValueError(f"Unknown OTP_STORE_BACKEND: {s.otp_store_backend}")
@@ -0,0 +1,124 @@
+"""
+In-process cache of serialized /user/me responses.
+
+Entries are dropped whenever a UserProfile (or its photo) is written through
+the ORM in this process, both at flush and again after commit so a read
+racing the transaction cannot re-cache the old row. Other worker processes
+only see the change once their entry's TTL runs out.
+"""
+
+from collections import OrderedDict
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+from .config import get_settings
+from .metrics import CallbackGauge
+from .models import UserProfile, UserProfilePhoto
+import threading
+import time
+
+
+class ProfileCache:
+    def __init__(self, enabled: bool, ttl_seconds: int, max_entries: int, max_bytes: int):
+        self.enabled = enabled
+        self.ttl = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Bumped on every invalidation so a read that started before a write
+        # can't store what it read
+        self.version = 0
+        self._entries: OrderedDict[str, tuple[bytes, float]] = OrderedDict()
+        # Invalidation can arrive from threadpool sessions
+        self._lock = threading.Lock()
+
+    def get(self, user_id: str) -> bytes | None:
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[1] <= time.monotonic():
+                if entry is not None:
+                    self._drop(user_id)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, user_id: str, body: bytes, version: int):
+        if not self.enabled or len(body) > self.max_bytes:
+            return
+        with self._lock:
+            if version != self.version:
+                return
+            self._drop(user_id)
+            self._entries[user_id] = (body, time.monotonic() + self.ttl)
+            self.size += len(body)
+            while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+                self.evictions += 1
+
+    def invalidate(self, user_id: str):
+        with self._lock:
+            self.version += 1
+            self._drop(user_id)
+
+    def _drop(self, user_id: str):
+        entry = self._entries.pop(user_id, None)
+        if entry is not None:
+            self.size -= len(entry[0])
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "bytes": self.size, "hits": self.hits,
+                "misses": self.misses, "evictions": self.evictions}
+
+
+_s = get_settings()
+profile_cache = ProfileCache(
+    enabled=_s.profile_cache_enabled,
+    ttl_seconds=_s.profile_cache_ttl_seconds,
+    max_entries=_s.profile_cache_max_entries,
+    max_bytes=_s.profile_cache_max_bytes,
+)
+CallbackGauge(
+    "profile_cache", "/user/me cache size, and lookups and evictions since start", ("stat",),
+    lambda: {(stat,): value for stat, value in profile_cache.stats().items()},
+)
+
+
+def _mark_dirty(target, user_id):
+    if user_id is None:
+        return
+    user_id = str(user_id)
+    profile_cache.invalidate(user_id)
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault("profile_cache_dirty", set()).add(user_id)
+
+
+@event.listens_for(UserProfile, "after_update")
+@event.listens_for(UserProfile, "after_delete")
+def _profile_written(mapper, connection, target):
+    _mark_dirty(target, target.id)
+
+
+@event.listens_for(UserProfilePhoto, "after_insert")
+@event.listens_for(UserProfilePhoto, "after_update")
+@event.listens_for(UserProfilePhoto, "after_delete")
+def _photo_written(mapper, connection, target):
+    _mark_dirty(target, target.user_id)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed(session):
+    for user_id in session.info.pop("profile_cache_dirty", ()):
+        profile_cache.invalidate(user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_dirty(session):
+    session.info.pop("profile_cache_dirty", None)
@@ -0,0 +1,181 @@
+"""
+Token-bucket rate limiting for abuse-prone endpoints.
+
+Limits are written "N/seconds": a bucket holds up to N tokens and refills
+at N per `seconds`, so short bursts of N pass and sustained traffic is
+held to the average rate. "memory" keeps buckets per process; "sqlite"
+shares them between the uvicorn workers on a host through the same kind
+of WAL-mode file the OTP store uses.
+
+Use the RateLimit dependency on a route:
+
+    @router.post("/login", dependencies=[Depends(RateLimit("login", mobile="5/300", ip="30/300"))])
+"""
+
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from fastapi import HTTPException, Request
+from starlette.concurrency import run_in_threadpool
+from .config import Settings, get_settings
+from .sqlite_store import SqliteStore
+import json
+import math
+import time
+
+
+def parse_limit(limit: str) -> tuple[int, float]:
+    """"5/300" -> (burst 5, refill 5/300 tokens per second)"""
+    count, _, seconds = limit.partition("/")
+    burst = int(count)
+    return burst, burst / float(seconds)
+
+
+def _take(tokens: float, updated: float, now: float, burst: int, rate: float) -> tuple[float, float]:
+    """(tokens left, seconds to wait); wait is 0 when a token was taken"""
+    tokens = min(burst, tokens + (now - updated) * rate)
+    if tokens >= 1:
+        return tokens - 1, 0.0
+    return tokens, (1 - tokens) / rate
+
+
+class RateLimiter(ABC):
+    """Interface: take one token from the bucket for key"""
+
+    @abstractmethod
+    async def hit(self, key: str, burst: int, rate: float) -> float:
+        """Returns 0 if allowed, else seconds until the next token"""
+
+
+class MemoryRateLimiter(RateLimiter):
+    """LRU-bounded dict of buckets; idle (refilled) buckets are swept periodically"""
+
+    SWEEP_EVERY = 1000
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._buckets: OrderedDict[str, tuple[float, float, int, float]] = OrderedDict()
+        self._hits = 0
+
+    def _sweep(self, now: float):
+        # Least recently used first; stop at the first bucket still refilling
+        while self._buckets:
+            key, (tokens, updated, burst, rate) = next(iter(self._buckets.items()))
+            if tokens + (now - updated) * rate < burst:
+                break
+            del self._buckets[key]
+
+    async def hit(self, key: str, burst: int, rate: float) -> float:
+        now = time.monotonic()
+        self._hits += 1
+        if self._hits % self.SWEEP_EVERY == 0:
+            self._sweep(now)
+        entry = self._buckets.get(key)
+        tokens, updated = (entry[0], entry[1]) if entry else (burst, now)
+        tokens, wait = _take(tokens, updated, now, burst, rate)
+        self._buckets[key] = (tokens, now, burst, rate)
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > self.max_entries:
+            self._buckets.popitem(last=False)
+        return wait
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+class SqliteRateLimiter(SqliteStore, RateLimiter):
+    """Buckets shared by worker processes on one host via a WAL-mode SQLite file"""
+
+    SWEEP_EVERY = 1000
+    # Buckets untouched this long are full again for any sane limit
+    IDLE_SECONDS = 24 * 3600
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self._hits = 0
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS rate_buckets ("
+            "key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+
+    def _hit(self, key: str, burst: int, rate: float, sweep: bool) -> float:
+        # Wall clock, since buckets are compared across processes
+        now = time.time()
+        conn = self._conn()
+        # IMMEDIATE takes the write lock up front so the read-modify-write is atomic
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated_at FROM rate_buckets WHERE key = ?", (key,)).fetchone()
+            tokens, updated = row if row else (burst, now)
+            tokens, wait = _take(tokens, updated, now, burst, rate)
+            conn.execute(
+                "INSERT INTO rate_buckets (key, tokens, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at",
+                (key, tokens, now),
+            )
+            if sweep:
+                conn.execute("DELETE FROM rate_buckets WHERE updated_at < ?", (now - self.IDLE_SECONDS,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return wait
+
+    async def hit(self, key: str, burst: int, rate: float) -> float:
+        self._hits += 1
+        sweep = self._hits % self.SWEEP_EVERY == 0
+        return await run_in_threadpool(self._hit, key, burst, rate, sweep)
+
+
+def create_rate_limiter(s: Settings) -> RateLimiter:
+    if s.rate_limit_backend == "memory":
+        return MemoryRateLimiter(s.rate_limit_max_entries)
+    if s.rate_limit_backend == "sqlite":
+        return SqliteRateLimiter(s.rate_limit_path)
+    raise ValueError(f"Unknown RATE_LIMIT_BACKEND: {s.rate_limit_backend}")
+
+
+limiter = create_rate_limiter(get_settings())
+
+
+def client_ip(request: Request) -> str:
+    s = get_settings()
+    if s.rate_limit_trust_forwarded:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            # Entries our own proxies appended are on the right; anything
+            # further left came from the client and can be forged
+            hops = [h.strip() for h in forwarded.split(",")]
+            return hops[-min(s.rate_limit_forwarded_hops, len(hops))]
+    return request.client.host if request.client else "unknown"
+
+
+class RateLimit:
+    """FastAPI dependency limiting a route per client IP and/or per the
+    mobile_no in the JSON body. Raises 429 with Retry-After."""
+
+    def __init__(self, name: str, mobile: str | None = None, ip: str | None = None):
+        self.name = name
+        self.mobile = parse_limit(mobile) if mobile else None
+        self.ip = parse_limit(ip) if ip else None
+
+    async def _mobile_no(self, request: Request) -> str | None:
+        try:
+            # Starlette caches the body, so the route still gets to parse it
+            body = await request.json()
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            return None
+        mobile_no = body.get("mobile_no") if isinstance(body, dict) else None
+        return str(mobile_no) if mobile_no else None
+
+    async def __call__(self, request: Request):
+        if not get_settings().rate_limit_enabled:
+            return
+        wait = 0.0
+        if self.ip:
+            wait = max(wait, await limiter.hit(f"{self.name}:ip:{client_ip(request)}", *self.ip))
+        if self.mobile:
+            mobile_no = await self._mobile_no(request)
+            if mobile_no:
+                wait = max(wait, await limiter.hit(f"{self.name}:mobile:{mobile_no}", *self.mobile))
+        if wait > 0:
+            raise HTTPException(status_code=429, detail="rate_limited", headers={"Retry-After": str(math.ceil(wait))})
@@ -0,0 +1,238 @@
+"""
+Read-replica routing for read-only routes.
+
+Routes that only read take get_read_db instead of get_db. Their sessions go
+to the DATABASE_REPLICA_URLS in turn, skipping a replica for a while after
+it fails to connect, and fall back to the primary when none is usable. The
+session is only opened by the route's first query.
+
+A user's reads stay on the primary for REPLICA_READ_YOUR_WRITES_SECONDS
+after their own writes, so they never read their profile from before a
+change that replication hasn't delivered yet. Writes are noticed per
+process: ORM writes to a profile or its photo are tracked automatically,
+and Core writes (registration) call mark_written(). A freshly issued token
+counts too, which covers register-then-login when the two requests landed
+on different workers.
+"""
+
+from fastapi import Request
+from jose import JWTError
+from sqlalchemy import event
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session, object_session, sessionmaker
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from .config import get_settings
+from .db import ThreadpoolSession, create_pooled_engine, open_session
+from .metrics import Counter
+from .models import UserProfile, UserProfilePhoto
+from .security import decode_token
+import itertools
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DB_READS = Counter("db_read_sessions_total", "Sessions opened by get_read_db, by target", ("target",))
+
+
+class Replica:
+    def __init__(self, label: str, url: str):
+        self.label = label
+        self.url = url
+        self.down_until = 0.0
+        self._engine = None
+        self._async_engine = None
+        self._sessions = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False)
+        self._async_sessions = async_sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False)
+
+    async def open(self, async_: bool):
+        """A connected session; raises DBAPIError if the replica is unreachable"""
+        if async_:
+            if self._async_engine is None:
+                self._async_engine = create_pooled_engine(self.url, f"{self.label}_async", async_=True)
+                self._async_sessions.configure(bind=self._async_engine)
+            session = self._async_sessions()
+            try:
+                await session.connection()
+            except BaseException:
+                await session.close()
+                raise
+            return session
+        if self._engine is None:
+            # Engines are created on first use, after any pre-fork import
+            self._engine = create_pooled_engine(self.url, self.label)
+            self._sessions.configure(bind=self._engine)
+        session = ThreadpoolSession(self._sessions())
+        try:
+            await session.run_sync(Session.connection)
+        except BaseException:
+            await session.close()
+            raise
+        return session
+
+
+class ReplicaSet:
+    """Round-robin over replicas that aren't marked down"""
+
+    def __init__(self, urls: list[str], retry_seconds: float):
+        self.replicas = [Replica(f"replica{i}", url) for i, url in enumerate(urls)]
+        self.retry_seconds = retry_seconds
+        self._turn = itertools.count()
+
+    def candidates(self) -> list[Replica]:
+        """Healthy replicas, starting with the next in turn"""
+        if not self.replicas:
+            return []
+        start = next(self._turn) % len(self.replicas)
+        now = time.monotonic()
+        ordered = self.replicas[start:] + self.replicas[:start]
+        return [r for r in ordered if r.down_until <= now]
+
+    def mark_down(self, replica: Replica, error: Exception):
+        replica.down_until = time.monotonic() + self.retry_seconds
+        logger.warning("Read replica %s unavailable for %ss: %s", replica.label, self.retry_seconds, error)
+
+
+class RecentWrites:
+    """Users who wrote within the window, in this process"""
+
+    MAX_ENTRIES = 100000
+
+    def __init__(self, window_seconds: float):
+        self.window = window_seconds
+        self._until: dict[str, float] = {}
+        # Marked from threadpool sessions too
+        self._lock = threading.Lock()
+
+    def mark(self, user_id: str):
+        if self.window <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if len(self._until) >= self.MAX_ENTRIES:
+                self._until = {u: t for u, t in self._until.items() if t > now}
+            self._until[user_id] = now + self.window
+
+    def __contains__(self, user_id: str) -> bool:
+        until = self._until.get(user_id)
+        return until is not None and until > time.monotonic()
+
+
+_s = get_settings()
+replicas = ReplicaSet(
+    [u.strip() for u in _s.database_replica_urls.split(",") if u.strip()],
+    _s.replica_retry_seconds,
+)
+recent_writes = RecentWrites(_s.replica_read_your_writes_seconds)
+
+
+def mark_written(user_id):
+    """Keep user_id's reads on the primary for the read-your-writes window"""
+    recent_writes.mark(str(user_id))
+
+
+def _mark_session_write(target, user_id):
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault("replica_written", set()).add(str(user_id))
+
+
+@event.listens_for(UserProfile, "after_insert")
+@event.listens_for(UserProfile, "after_update")
+@event.listens_for(UserProfile, "after_delete")
+def _profile_written(mapper, connection, target):
+    _mark_session_write(target, target.id)
+
+
+@event.listens_for(UserProfilePhoto, "after_insert")
+@event.listens_for(UserProfilePhoto, "after_update")
+@event.listens_for(UserProfilePhoto, "after_delete")
+def _photo_written(mapper, connection, target):
+    _mark_session_write(target, target.user_id)
+
+
+@event.listens_for(Session, "after_commit")
+def _remember_committed(session):
+    for user_id in session.info.pop("replica_written", ()):
+        recent_writes.mark(user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_uncommitted(session):
+    session.info.pop("replica_written", None)
+
+
+def _wants_primary(request: Request, window: float) -> bool:
+    """Whether this request is about a user still inside their read-your-writes window"""
+    if window <= 0:
+        return False
+    user_ids = set()
+    if "user_id" in request.path_params:
+        user_ids.add(str(request.path_params["user_id"]))
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() == "bearer" and token:
+        try:
+            payload = decode_token(token)
+        except JWTError:
+            payload = {}  # The route rejects it
+        if payload.get("sub"):
+            user_ids.add(str(payload["sub"]))
+        if time.time() - payload.get("iat", 0) < window:
+            return True
+    return any(user_id in recent_writes for user_id in user_ids)
+
+
+async def _open_read_session(prefer_primary: bool):
+    s = get_settings()
+    if replicas.replicas and not prefer_primary:
+        for replica in replicas.candidates():
+            try:
+                db = await replica.open(s.db_async)
+            except DBAPIError as e:
+                replicas.mark_down(replica, e)
+                continue
+            DB_READS.inc(replica.label)
+            return db
+    DB_READS.inc("primary")
+    return await open_session()
+
+
+class ReadSession:
+    """AsyncSession-shaped handle yielded by get_read_db. The replica or
+    primary session behind it is picked, and connected, on the first query,
+    so a handler that answers from a cache never checks out a connection."""
+
+    def __init__(self, prefer_primary: bool):
+        self._prefer_primary = prefer_primary
+        self._session = None
+
+    async def _resolve(self):
+        if self._session is None:
+            self._session = await _open_read_session(self._prefer_primary)
+        return self._session
+
+    async def execute(self, *args, **kwargs):
+        return await (await self._resolve()).execute(*args, **kwargs)
+
+    async def scalar(self, *args, **kwargs):
+        return await (await self._resolve()).scalar(*args, **kwargs)
+
+    async def scalars(self, *args, **kwargs):
+        return await (await self._resolve()).scalars(*args, **kwargs)
+
+    async def get(self, *args, **kwargs):
+        return await (await self._resolve()).get(*args, **kwargs)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+
+async def get_read_db(request: Request):
+    """FastAPI dependency like get_db, for routes that never write"""
+    db = ReadSession(_wants_primary(request, get_settings().replica_read_your_writes_seconds))
+    try:
+        yield db
+    finally:
+        await db.close()
@@ -0,0 +1,22 @@
+"""
+JSON response class used by the routers.
+
+Rendered with orjson when it is installed, else with compact json.dumps.
+Routes declare response models, so FastAPI hands this class validated,
+already JSON-safe data instead of walking it with jsonable_encoder.
+"""
+
+import json
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # Optional; falls back to the stdlib encoder
+    orjson = None
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(content)
+        return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
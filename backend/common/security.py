@@ -1,9 +1,30 @@
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from passlib.context import CryptContext
 from jose import jwt
-from .config import Settings
+from .config import Settings, get_settings
+from .cpus import available_cpus
+from .metrics import Counter, Histogram, CallbackGauge
+import asyncio
+import hashlib
+import logging
+import threading
+import time
 
 
-pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
+def _build_pwd_context(s: Settings) -> CryptContext:
+    return CryptContext(
+        schemes=["argon2"],
+        deprecated="auto",
+        argon2__rounds=s.argon2_time_cost,
+        argon2__memory_cost=s.argon2_memory_cost,
+        argon2__parallelism=s.argon2_parallelism,
+    )
+
+
+_settings = get_settings()
+pwd_context = _build_pwd_context(_settings)
 
 
 def hash_password(password: str) -> str:
@@ -14,12 +35,178 @@ def verify_password(plain: str, hashed: str) -> bool:
     return pwd_context.verify(plain, hashed)
 
 
+def verify_and_update_password(plain: str, hashed: str) -> tuple[bool, str | None]:
+    """Verify, and return a new hash if the stored one uses outdated parameters"""
+    return pwd_context.verify_and_update(plain, hashed)
+
+
+class PasswordHashingBusy(Exception):
+    """Raised when the hashing pool already has its maximum of pending calls"""
+
+    def __init__(self, retry_after: int):
+        super().__init__("password hashing pool saturated")
+        self.retry_after = retry_after
+
+
+PASSWORD_HASH_DURATION = Histogram(
+    "password_hash_duration_seconds", "Argon2 hash/verify time including pool queueing", ("op",),
+    (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+PASSWORD_HASH_REJECTED = Counter("password_hash_rejected_total", "Argon2 calls refused as busy", ("op",))
+PASSWORD_HASH_ERRORS = Counter("password_hash_errors_total", "Argon2 calls that raised", ("op",))
+
+
+class PasswordHashExecutor:
+    """Runs Argon2 work in a dedicated process pool so that login/register
+    bursts cannot starve the workers serving other endpoints.
+
+    At most ``workers + max_pending`` calls are admitted at once; beyond that
+    callers get PasswordHashingBusy immediately instead of queueing.
+    """
+
+    def __init__(self, workers: int, max_pending: int, retry_after: int):
+        self.workers = workers or available_cpus()
+        self.capacity = self.workers + max_pending
+        self.retry_after = retry_after
+        self.in_flight = 0
+        self._pool = None
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        # Created lazily so each uvicorn worker forks its own pool after startup
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    async def _run(self, op: str, fn, *args):
+        if self.in_flight >= self.capacity:
+            PASSWORD_HASH_REJECTED.inc(op)
+            raise PasswordHashingBusy(self.retry_after)
+        self.in_flight += 1
+        started = time.perf_counter()
+        pool = self._get_pool()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(pool, fn, *args)
+        except BrokenProcessPool:
+            # A child died (e.g. OOM-killed) and took the pool with it; the
+            # next call starts a fresh one. Concurrent callers share the
+            # failure, so only replace the pool once.
+            PASSWORD_HASH_ERRORS.inc(op)
+            if self._pool is pool:
+                logging.error("Password hashing pool broke; replacing it")
+                pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+            raise PasswordHashingBusy(self.retry_after)
+        except Exception:
+            PASSWORD_HASH_ERRORS.inc(op)
+            raise
+        finally:
+            self.in_flight -= 1
+            elapsed = time.perf_counter() - started
+            PASSWORD_HASH_DURATION.observe(elapsed, op)
+            logging.debug("argon2 %s took %.1f ms", op, elapsed * 1000)
+
+    async def hash(self, password: str) -> str:
+        return await self._run("hash", hash_password, password)
+
+    async def verify_and_update(self, plain: str, hashed: str) -> tuple[bool, str | None]:
+        return await self._run("verify", verify_and_update_password, plain, hashed)
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+password_hasher = PasswordHashExecutor(
+    workers=_settings.password_hash_workers,
+    max_pending=_settings.password_hash_max_pending,
+    retry_after=_settings.password_hash_retry_after,
+)
+CallbackGauge(
+    "password_hash_in_flight", "Argon2 calls running or queued in the process pool", (),
+    lambda: {(): password_hasher.in_flight},
+)
+
+
+class VerifiedTokenCache:
+    """Bounded LRU of already-verified token payloads keyed by token digest.
+
+    An entry lives until the token's ``exp`` or ``ttl`` seconds, whichever
+    comes first, so expired tokens always fall through to a full decode.
+    """
+
+    def __init__(self, maxsize: int, ttl: int):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[bytes, tuple[dict, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str) -> dict | None:
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            payload, expires_at = entry
+            if time.time() >= expires_at:
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return payload
+
+    def put(self, token: str, payload: dict):
+        if self.maxsize <= 0:
+            return
+        expires_at = time.time() + self.ttl
+        if "exp" in payload:
+            expires_at = min(expires_at, float(payload["exp"]))
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = (payload, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+token_cache = VerifiedTokenCache(_settings.token_cache_size, _settings.token_cache_ttl_seconds)
+CallbackGauge(
+    "token_cache_lookups", "Verified-token cache lookups since start, by result", ("result",),
+    lambda: {("hit",): token_cache.hits, ("miss",): token_cache.misses},
+)
+
+
 def create_access_token(sub: str, category: str) -> str:
-    s = Settings()
-    payload = {"sub": sub, "category": category}
+    s = get_settings()
+    now = int(time.time())
+    payload = {
+        "sub": sub,
+        "category": category,
+        "iat": now,
+        "exp": now + s.access_token_expire_minutes * 60,
+    }
     return jwt.encode(payload, s.jwt_secret, algorithm=s.jwt_algorithm)
 
 
 def decode_token(token: str) -> dict:
-    s = Settings()
-    return jwt.decode(token, s.jwt_secret, algorithms=[s.jwt_algorithm])
+    """Verify a token, raising jose.JWTError if it is invalid or expired"""
+    payload = token_cache.get(token)
+    if payload is not None:
+        return payload
+    s = get_settings()
+    payload = jwt.decode(token, s.jwt_secret, algorithms=[s.jwt_algorithm])
+    token_cache.put(token, payload)
+    return payload
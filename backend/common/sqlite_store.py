@@ -0,0 +1,28 @@
+"""
+Base for state shared by the worker processes on one host through a
+WAL-mode SQLite file (the "sqlite" OTP store and rate limiter).
+"""
+
+import os
+import sqlite3
+import threading
+
+
+class SqliteStore:
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3 connections are per thread; the threadpool reuses its threads.
+        # The pid check stops a worker forked after __init__ (gunicorn
+        # preload_app) from using the connection its parent opened.
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
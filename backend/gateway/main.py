@@ -1,15 +1,32 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response
 from services.auth.router import router as auth_router
 from services.user.router import router as user_router
-from fastapi.staticfiles import StaticFiles
-from services.files.router import router as files_router
-import logging
+from services.files.router import router as files_router, UPLOAD_DIR
+from services.files.static import UploadStaticFiles
+from common.security import password_hasher
+from common.images import image_pool
+from common import db, metrics
+from common.config import get_settings
+from common.compression import CompressionMiddleware
+from common.log import configure_logging, RequestIdMiddleware
 import os
 
 
-logging.basicConfig(level=logging.INFO)
-app = FastAPI()
+configure_logging()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    async with db.database_lifespan():
+        yield
+    password_hasher.shutdown()
+    image_pool.shutdown()
+
+
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -18,11 +35,40 @@ app.add_middleware(
     ,
     allow_headers=["*"]
 )
+_s = get_settings()
+if _s.compression_enabled:
+    app.add_middleware(
+        CompressionMiddleware,
+        minimum_size=_s.compression_min_size,
+        content_types=[t.strip() for t in _s.compression_content_types.split(",") if t.strip()],
+        encodings=[e.strip() for e in _s.compression_encodings.split(",") if e.strip()],
+    )
+# Outside CORS and compression, so CORS preflights and error responses are
+# timed too; only RequestIdMiddleware, added after it, wraps it
+app.add_middleware(metrics.MetricsMiddleware)
+app.add_middleware(RequestIdMiddleware)
 app.include_router(auth_router, prefix="/auth")
 app.include_router(user_router, prefix="/user")
 app.include_router(files_router, prefix="/files")
 
+
+@app.get("/ready")
+async def ready():
+    """Readiness probe: 503 until the schema is migrated and the pool is warm"""
+    if not db.db_status["ready"]:
+        # Startup failed (e.g. database down); try again on each probe
+        await db.init_database()
+    body = dict(db.db_status)
+    body["pool"] = db.pool_stats()
+    return JSONResponse(body, status_code=200 if body["ready"] else 503)
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """This worker's metrics in Prometheus text format"""
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
 # Create uploads directory if it doesn't exist
-uploads_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "uploads")
-os.makedirs(uploads_dir, exist_ok=True)
-app.mount("/files/static", StaticFiles(directory=uploads_dir), name="files-static")
\ No newline at end of file
+os.makedirs(UPLOAD_DIR, exist_ok=True)
+app.mount("/files/static", UploadStaticFiles(directory=UPLOAD_DIR), name="files-static")
\ No newline at end of file
@@ -0,0 +1,34 @@
+"""
+Gunicorn worker class for the gateway (see gunicorn.conf.py).
+
+uvicorn picks uvloop and httptools itself when they are installed ("auto"),
+and falls back to asyncio and h11 otherwise.
+"""
+
+import warnings
+
+with warnings.catch_warnings():
+    # uvicorn.workers warns that it is moving to the uvicorn-worker package
+    warnings.simplefilter("ignore", DeprecationWarning)
+    from uvicorn.workers import UvicornWorker
+
+from common.config import get_settings
+from common.log import attach_uvicorn_loggers
+
+_s = get_settings()
+
+
+class GatewayWorker(UvicornWorker):
+    CONFIG_KWARGS = {
+        "loop": "auto",
+        "http": "auto",
+        "limit_concurrency": _s.web_limit_concurrency or None,
+        # Finish in-flight requests on SIGTERM, but leave the lifespan
+        # shutdown time to close the pools before gunicorn's graceful_timeout
+        "timeout_graceful_shutdown": _s.web_graceful_timeout_seconds,
+    }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # UvicornWorker points uvicorn's loggers at gunicorn's handlers
+        attach_uvicorn_loggers()
@@ -0,0 +1,59 @@
+"""
+Gunicorn settings for the gateway; start.py runs
+
+    gunicorn -c gunicorn.conf.py gateway.main:app
+
+from backend/. The app is imported once in the master (preload_app) and
+the workers fork from it, sharing the imported code and settings
+copy-on-write. Database engines and process pools are created after the
+fork, in each worker's lifespan or on first use.
+
+SIGTERM (a deploy) stops accepting connections and gives in-flight
+requests WEB_GRACEFUL_TIMEOUT_SECONDS to finish before the lifespan
+shutdown runs.
+"""
+
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common.config import get_settings
+from common.cpus import available_cpus
+
+_s = get_settings()
+_cpus = available_cpus()
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = _s.web_concurrency or _cpus
+worker_class = "gateway.worker.GatewayWorker"
+preload_app = True
+backlog = _s.web_backlog
+keepalive = _s.web_keepalive_seconds
+# uvicorn drains for web_graceful_timeout_seconds; the margin covers the lifespan shutdown
+graceful_timeout = _s.web_graceful_timeout_seconds + 5
+# uvicorn logs requests through common.log
+accesslog = None
+errorlog = "-"
+
+if workers > 1:
+    _log = logging.getLogger("gunicorn.error")
+    _overrides = {}
+    # Every worker has its own Argon2 pool; split the CPUs between them
+    # rather than giving each worker one process per CPU
+    if _s.password_hash_workers == 0:
+        _overrides["PASSWORD_HASH_WORKERS"] = str(max(1, _cpus // workers))
+    # In-memory OTPs and rate-limit buckets are per process: an OTP sent
+    # through one worker would not verify on another
+    for field, env in (("otp_store_backend", "OTP_STORE_BACKEND"), ("rate_limit_backend", "RATE_LIMIT_BACKEND")):
+        if getattr(_s, field) != "memory":
+            continue
+        if field in _s.model_fields_set:
+            _log.warning("%s=memory with %d workers; each worker keeps its own state", env, workers)
+        else:
+            _overrides[env] = "sqlite"
+    if _overrides:
+        os.environ.update(_overrides)
+        # Re-read before the app is preloaded
+        get_settings.cache_clear()
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Backfill legacy base64 profile photos into user_profile_photos.
+
+Rows written before photos moved out of user_profiles still carry the image
+twice (profile_photo_data and a data: URI in profile_photo_url). This walks the
+table in keyset-paginated batches by id, decodes each photo once, stores the
+raw bytes in user_profile_photos and rewrites the row to the short
+/user/{id}/photo URL. Batches run on --workers threads, each in its own
+transaction; a checkpoint file records the highest id below which every batch
+has committed, so the job can be stopped and resumed.
+
+    python scripts/backfill_profile_photos.py --dry-run
+    python scripts/backfill_profile_photos.py --workers 4 --batch-size 200
+"""
+
+import argparse
+import base64
+import binascii
+import hashlib
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import select, update, or_, bindparam
+from sqlalchemy.dialects.postgresql import insert
+
+# Add the backend directory to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from common.config import get_settings
+from common.db import create_pooled_engine
+from common.models import UserProfile, UserProfilePhoto, profile_photo_path
+
+profiles = UserProfile.__table__
+photos = UserProfilePhoto.__table__
+
+NEEDS_BACKFILL = or_(
+    profiles.c.profile_photo_data.isnot(None),
+    profiles.c.profile_photo_url.like("data:%"),
+)
+
+
+def decode_legacy(data_b64: str | None, url: str | None, mime_type: str | None) -> tuple[bytes, str]:
+    """Raw bytes and mime type from the base64 column, else from the data: URI"""
+    if not data_b64 and url and url.startswith("data:"):
+        header, _, data_b64 = url.partition(",")
+        mime_type = mime_type or header[5:].split(";")[0] or None
+    return base64.b64decode(data_b64, validate=True), mime_type or "application/octet-stream"
+
+
+def load_checkpoint(path: str | None) -> dict:
+    if path and os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return {"last_id": None, "rows": 0, "migrated": 0, "failed": 0, "bytes_before": 0, "bytes_after": 0}
+
+
+def save_checkpoint(path: str, state: dict):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+
+def process_batch(engine, ids: list, dry_run: bool) -> dict:
+    stats = {"rows": 0, "migrated": 0, "failed": 0, "bytes_before": 0, "bytes_after": 0}
+    with engine.connect() as conn:
+        query = (
+            select(profiles.c.id, profiles.c.profile_photo_data, profiles.c.profile_photo_url,
+                   profiles.c.profile_photo_mime_type)
+            .where(profiles.c.id.in_(ids), NEEDS_BACKFILL)
+        )
+        # A dry run writes nothing, so it has nothing to lock
+        rows = conn.execute(query if dry_run else query.with_for_update()).all()
+
+        decoded = {}
+        for user_id, data_b64, url, mime_type in rows:
+            stats["rows"] += 1
+            try:
+                data, mime_type = decode_legacy(data_b64, url, mime_type)
+            except (binascii.Error, ValueError) as e:
+                stats["failed"] += 1
+                print(f"   ⚠️  {user_id}: undecodable photo ({e}), left as is", file=sys.stderr)
+                continue
+            decoded[user_id] = (data, mime_type, hashlib.sha256(data).hexdigest(), len(data_b64 or "") + len(url or ""))
+
+        migrated = set(decoded)
+        if decoded and not dry_run:
+            # A photo uploaded since the legacy one was written wins, and its
+            # profile keeps pointing at it
+            migrated = set(conn.execute(
+                insert(photos).on_conflict_do_nothing(index_elements=["user_id"]).returning(photos.c.user_id),
+                [{"user_id": user_id, "data": data, "mime_type": mime_type, "sha256": digest, "size": len(data)}
+                 for user_id, (data, mime_type, digest, _) in decoded.items()],
+            ).scalars())
+            if migrated:
+                conn.execute(
+                    update(profiles)
+                    .where(profiles.c.id == bindparam("b_id"))
+                    .values(profile_photo_data=None, profile_photo_url=bindparam("b_url"),
+                            profile_photo_mime_type=bindparam("b_mime")),
+                    [{"b_id": user_id, "b_url": profile_photo_path(user_id, decoded[user_id][2]),
+                      "b_mime": decoded[user_id][1]}
+                     for user_id in migrated],
+                )
+            conn.commit()
+        else:
+            conn.rollback()
+
+        for user_id in migrated:
+            data, _, _, legacy_size = decoded[user_id]
+            stats["migrated"] += 1
+            stats["bytes_before"] += legacy_size
+            stats["bytes_after"] += len(data)
+    return stats
+
+
+def next_ids(engine, after, batch_size: int) -> list:
+    query = select(profiles.c.id).where(NEEDS_BACKFILL).order_by(profiles.c.id).limit(batch_size)
+    if after is not None:
+        query = query.where(profiles.c.id > after)
+    with engine.connect() as conn:
+        return list(conn.execute(query).scalars())
+
+
+def report(state: dict, started: float, dry_run: bool):
+    elapsed = time.perf_counter() - started
+    rate = state["rows"] / elapsed if elapsed > 0 else 0.0
+    mb_before = state["bytes_before"] / 1e6
+    mb_after = state["bytes_after"] / 1e6
+    label = "would migrate" if dry_run else "migrated"
+    print(f"   {label} {state['migrated']}/{state['rows']} rows, {state['failed']} failed, "
+          f"{mb_before:.1f} MB base64 -> {mb_after:.1f} MB raw, {rate:,.0f} rows/s", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move legacy base64 profile photos into user_profile_photos")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--checkpoint", default="backfill_profile_photos.checkpoint.json")
+    parser.add_argument("--restart", action="store_true", help="Ignore an existing checkpoint")
+    parser.add_argument("--dry-run", action="store_true", help="Decode and report, write nothing")
+    parser.add_argument("--limit", type=int, help="Stop after roughly this many rows")
+    args = parser.parse_args()
+
+    url = get_settings().database_url
+    if not url:
+        print("❌ DATABASE_URL not configured")
+        sys.exit(1)
+    # Same driver URL and pooler settings as the app, sized for the workers
+    engine = create_pooled_engine(url, "backfill", pool_size=args.workers + 1, max_overflow=0)
+
+    # A dry run never advances the real checkpoint
+    checkpoint = None if args.dry_run else args.checkpoint
+    state = load_checkpoint(None if args.restart else checkpoint)
+    if state["last_id"]:
+        print(f"Resuming after id {state['last_id']} ({state['rows']} rows done)")
+    cursor = state["last_id"]
+    started = time.perf_counter()
+    seen = 0
+
+    # Batches are submitted in id order and retired in the same order, so the
+    # checkpoint only ever covers ids whose batch has committed
+    pending = deque()
+    try:
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            while True:
+                while len(pending) < args.workers * 2 and (args.limit is None or seen < args.limit):
+                    ids = next_ids(engine, cursor, args.batch_size)
+                    if not ids:
+                        break
+                    cursor = ids[-1]
+                    seen += len(ids)
+                    pending.append((ids[-1], pool.submit(process_batch, engine, ids, args.dry_run)))
+                if not pending:
+                    break
+                last_id, future = pending.popleft()
+                for key, value in future.result().items():
+                    state[key] += value
+                state["last_id"] = str(last_id)
+                if checkpoint:
+                    save_checkpoint(checkpoint, state)
+                report(state, started, args.dry_run)
+    except KeyboardInterrupt:
+        print("Interrupted; rerun to resume from the checkpoint", file=sys.stderr)
+        sys.exit(130)
+    except Exception as e:
+        print(f"❌ Backfill failed: {e}")
+        sys.exit(1)
+
+    print("✅ Dry run complete" if args.dry_run else "✅ Backfill complete")
+    report(state, started, args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
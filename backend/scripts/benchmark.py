@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""
+In-process benchmark of the gateway endpoints.
+
+Drives gateway.main:app through httpx's ASGI transport (startup lifespan
+included) against the database in DATABASE_URL - use a local Postgres, not
+production. Each scenario reports throughput, p50/p95/p99 latency and SQL
+statements per request; results are written as JSON so runs can be
+compared across commits.
+
+    python scripts/benchmark.py --requests 200 --concurrency 16 -o bench.json
+    python scripts/benchmark.py --baseline bench-main.json -o bench.json
+
+Latency includes background tasks (ASGITransport waits for the whole app
+call), and uploads are random bytes, so no image variants get rendered.
+Users, OTPs and uploads created by the run are removed afterwards.
+"""
+
+import argparse
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+from collections import Counter
+
+import httpx
+from sqlalchemy import delete, event
+
+# Add the backend directory to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+# Every request comes from one client address, so the auth rate limits
+# would turn most of the run into 429s; RATE_LIMIT_ENABLED=true measures them
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
+from common import db
+from common.config import get_settings
+from common.models import UserProfile
+from gateway.main import app
+from services.auth import router as auth_router
+from services.files.router import UPLOAD_DIR
+
+SCENARIOS = ["send_otp", "register", "login", "me", "upload", "mixed"]
+MIXED_WEIGHTS = {"me": 60, "login": 15, "send_otp": 15, "upload": 10}
+PASSWORD = "bench-password"
+
+# Per-request SQL statement counter; None outside a measured request
+_queries: contextvars.ContextVar[list | None] = contextvars.ContextVar("bench_queries", default=None)
+
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    counter = _queries.get()
+    if counter is not None:
+        counter[0] += 1
+
+
+def install_query_counter():
+    engines = [db.Engine] + ([db.AsyncEngine.sync_engine] if db.AsyncEngine is not None else [])
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", _count_query)
+
+
+class Run:
+    """State shared by the scenarios of one benchmark run"""
+
+    def __init__(self, client: httpx.AsyncClient):
+        self.client = client
+        self.prefix = f"bench{uuid.uuid4().hex[:6]}"
+        self.seq = 0
+        self.users: list[str] = []
+        self.tokens: list[str] = []
+        self.uploads: list[str] = []
+
+    def mobile(self) -> str:
+        self.seq += 1
+        return f"{self.prefix}{self.seq:06d}"
+
+
+async def op_send_otp(run: Run, i: int) -> httpx.Response:
+    return await run.client.post("/auth/send-otp", json={"mobile_no": run.mobile()})
+
+
+async def op_register(run: Run, i: int) -> httpx.Response:
+    mobile = run.mobile()
+    # Seeded directly so only the register call itself is measured
+    await auth_router.otp_store.put(mobile, "123456", 300)
+    return await _register(run, mobile)
+
+
+async def _register(run: Run, mobile: str) -> httpx.Response:
+    response = await run.client.post("/auth/register", json={
+        "full_name": "Bench User", "mobile_no": mobile, "password": PASSWORD,
+        "category": "Vendor", "otp_code": "123456",
+    })
+    if response.status_code == 200:
+        run.users.append(mobile)
+    return response
+
+
+async def op_login(run: Run, i: int) -> httpx.Response:
+    response = await run.client.post("/auth/login", json={
+        "mobile_no": run.users[i % len(run.users)], "password": PASSWORD,
+    })
+    if response.status_code == 200 and len(run.tokens) < len(run.users):
+        run.tokens.append(response.json()["access_token"])
+    return response
+
+
+async def op_me(run: Run, i: int) -> httpx.Response:
+    token = run.tokens[i % len(run.tokens)]
+    return await run.client.get("/user/me", headers={"Authorization": f"Bearer {token}"})
+
+
+async def op_upload(run: Run, i: int) -> httpx.Response:
+    data = os.urandom(32 * 1024)
+    response = await run.client.post("/files/upload", files={"file": ("bench.jpg", data, "image/jpeg")})
+    if response.status_code == 200:
+        run.uploads.append(response.json()["url"].rsplit("/", 1)[-1])
+    return response
+
+
+OPS = {"send_otp": op_send_otp, "register": op_register, "login": op_login, "me": op_me, "upload": op_upload}
+
+
+async def ensure_fixtures(run: Run, users: int):
+    """Users and tokens needed by login/me when register/login weren't run first"""
+    while len(run.users) < users:
+        mobile = run.mobile()
+        await auth_router.otp_store.put(mobile, "123456", 300)
+        response = await _register(run, mobile)
+        if response.status_code != 200:
+            raise RuntimeError(f"fixture registration failed: {response.status_code} {response.text}")
+    i = 0
+    while len(run.tokens) < len(run.users):
+        await op_login(run, i)
+        i += 1
+
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+async def run_scenario(run: Run, name: str, requests: int, concurrency: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    if name == "mixed":
+        ops = rng.choices(list(MIXED_WEIGHTS), weights=list(MIXED_WEIGHTS.values()), k=requests)
+    else:
+        ops = [name] * requests
+    plan = iter(enumerate(ops))
+    latencies, query_counts = [], []
+    statuses = Counter()
+
+    async def worker():
+        for i, op in plan:
+            counter = [0]
+            token = _queries.set(counter)
+            started = time.perf_counter()
+            try:
+                response = await OPS[op](run, i)
+                statuses[response.status_code] += 1
+            except Exception as e:
+                statuses[type(e).__name__] += 1
+            finally:
+                latencies.append((time.perf_counter() - started) * 1000)
+                query_counts.append(counter[0])
+                _queries.reset(token)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    errors = sum(n for status, n in statuses.items() if not (isinstance(status, int) and status < 400))
+    return {
+        "requests": requests,
+        "errors": errors,
+        "statuses": {str(k): v for k, v in sorted(statuses.items(), key=str)},
+        "duration_s": round(elapsed, 3),
+        "throughput_rps": round(requests / elapsed, 1) if elapsed > 0 else 0.0,
+        "latency_ms": {
+            "mean": round(statistics.fmean(latencies), 2),
+            "p50": round(percentile(latencies, 50), 2),
+            "p95": round(percentile(latencies, 95), 2),
+            "p99": round(percentile(latencies, 99), 2),
+            "max": round(latencies[-1], 2),
+        },
+        "db_queries": {
+            "mean": round(statistics.fmean(query_counts), 2),
+            "max": max(query_counts),
+        },
+    }
+
+
+async def cleanup(run: Run):
+    # Every mobile number the run used, send-otp's included
+    for seq in range(1, run.seq + 1):
+        await auth_router.otp_store.delete(f"{run.prefix}{seq:06d}")
+    if db.Engine is not None:
+        with db.Engine.begin() as conn:
+            conn.execute(delete(UserProfile.__table__).where(UserProfile.mobile_no.like(f"{run.prefix}%")))
+    for name in run.uploads:
+        try:
+            os.remove(os.path.join(UPLOAD_DIR, name))
+        except FileNotFoundError:
+            pass
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(__file__)).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: dict, baseline_path: str, max_regression: float) -> bool:
+    """Print deltas against a previous run; False if any p95 regressed past the limit"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    ok = True
+    print(f"\nvs {baseline_path} ({baseline['meta'].get('git_revision')}):")
+    for name, current in results["scenarios"].items():
+        before = baseline["scenarios"].get(name)
+        if before is None:
+            continue
+        p95_before, p95_now = before["latency_ms"]["p95"], current["latency_ms"]["p95"]
+        change = (p95_now - p95_before) / p95_before * 100 if p95_before else 0.0
+        flag = ""
+        if change > max_regression:
+            ok = False
+            flag = "  ❌ regression"
+        print(f"  {name:<9} p95 {p95_before:>8.2f} -> {p95_now:>8.2f} ms ({change:+.1f}%), "
+              f"{before['throughput_rps']:>7.1f} -> {current['throughput_rps']:>7.1f} req/s, "
+              f"queries {before['db_queries']['mean']} -> {current['db_queries']['mean']}{flag}")
+    return ok
+
+
+async def benchmark(args) -> dict:
+    results = {"meta": {}, "scenarios": {}}
+    async with app.router.lifespan_context(app):
+        if not db.db_status["ready"]:
+            raise RuntimeError(f"database not ready: {db.db_status['error']}")
+        install_query_counter()
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            run = Run(client)
+            try:
+                for n, name in enumerate(args.scenarios):
+                    if name in ("login", "me", "mixed"):
+                        await ensure_fixtures(run, args.users)
+                    # One unmeasured pass so pools and caches are warm
+                    if args.warmup:
+                        await run_scenario(run, name, args.warmup, args.concurrency, args.seed + n)
+                    result = await run_scenario(run, name, args.requests, args.concurrency, args.seed + n)
+                    results["scenarios"][name] = result
+                    lat = result["latency_ms"]
+                    print(f"  {name:<9} {result['throughput_rps']:>8.1f} req/s  p50 {lat['p50']:>7.2f}  "
+                          f"p95 {lat['p95']:>7.2f}  p99 {lat['p99']:>7.2f} ms  "
+                          f"{result['db_queries']['mean']:.1f} queries/req  {result['errors']} errors",
+                          file=sys.stderr)
+            finally:
+                await cleanup(run)
+
+    s = get_settings()
+    results["meta"] = {
+        "git_revision": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "db_async": s.db_async,
+        "otp_store_backend": s.otp_store_backend,
+    }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark gateway endpoints in-process")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--requests", type=int, default=200, help="Measured requests per scenario")
+    parser.add_argument("--warmup", type=int, default=20, help="Unmeasured requests before each scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--users", type=int, default=20, help="Accounts used by login/me")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("-o", "--output", default="benchmark.json")
+    parser.add_argument("--baseline", help="Previous results file to compare against")
+    parser.add_argument("--max-regression", type=float, default=20.0,
+                        help="Fail if any p95 is this many percent slower than the baseline")
+    args = parser.parse_args()
+
+    # Per-request logs would dominate the measurement (random upload bytes
+    # also warn once each when variant rendering rejects them)
+    logging.getLogger().setLevel(logging.ERROR)
+    try:
+        results = asyncio.run(benchmark(args))
+    except Exception as e:
+        print(f"❌ Benchmark failed: {e}")
+        sys.exit(1)
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"✅ Results written to {args.output}")
+    if args.baseline and not compare(results, args.baseline, args.max_regression):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Apply pending schema migrations (see common/migrations.py).
+
+Meant as a release/pre-deploy step; set RUN_MIGRATIONS_ON_STARTUP=false on
+the web processes once this runs before them. Unlike startup, this also
+applies the online steps (backfills, concurrent index builds), which can
+take a while on a large table; interrupted, it resumes where it stopped.
+
+    python scripts/migrate.py
+    python scripts/migrate.py --status
+"""
+
+import argparse
+import os
+import sys
+
+# Add the backend directory to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from common import db
+from common.migrations import run_migrations, current_version, LATEST_VERSION
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply pending schema migrations")
+    parser.add_argument("--status", action="store_true", help="Print the current version and exit")
+    args = parser.parse_args()
+
+    try:
+        db.ensure_engine()
+        if args.status:
+            with db.Engine.connect() as conn:
+                version = current_version(conn)
+            print(f"Schema at version {version} (latest {LATEST_VERSION})")
+            return
+        version = run_migrations(db.Engine, include_online=True)
+        print(f"✅ Schema at version {version}")
+    except Exception as e:
+        print(f"❌ Migration failed: {e}")
+        sys.exit(1)
+    finally:
+        if db.Engine is not None:
+            db.Engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Bulk-create merchant accounts from a CSV or NDJSON file.
+
+Each record needs full_name, mobile_no, password and category; the other
+profile fields (city, latitude, ...) are optional. Passwords are hashed on
+a process pool, then rows go in as multi-row INSERT ... ON CONFLICT
+(mobile_no) DO NOTHING batches, so numbers that are already registered are
+reported and skipped instead of failing the batch. A number repeated in the
+input is created once, from its first record. No OTP is involved; this is
+for admin onboarding.
+
+    python scripts/onboard_merchants.py merchants.csv
+    python scripts/onboard_merchants.py merchants.ndjson --batch-size 500 --workers 4
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# Add the backend directory to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from common import db
+from common.accounts import new_profile_row, bulk_insert_statement
+from common.cpus import available_cpus
+from common.security import hash_password
+
+CATEGORIES = {"Vendor", "Women Merchant", "Customer"}
+REQUIRED = ("full_name", "mobile_no", "password", "category")
+
+
+def read_records(path: str):
+    if path.endswith((".ndjson", ".jsonl")):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    else:
+        with open(path, newline="", encoding="utf-8") as f:
+            for record in csv.DictReader(f):
+                yield {k: (v if v != "" else None) for k, v in record.items()}
+
+
+def batches(records, size: int):
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def validate(record: dict) -> str | None:
+    missing = [f for f in REQUIRED if not record.get(f)]
+    if missing:
+        return f"missing {', '.join(missing)}"
+    if record["category"] not in CATEGORIES:
+        return f"unknown category {record['category']!r}"
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-create merchant accounts")
+    parser.add_argument("path", help="CSV or NDJSON (.ndjson/.jsonl) file")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=available_cpus(), help="Password hashing processes")
+    args = parser.parse_args()
+
+    created = skipped = duplicates = invalid = 0
+    # Every number seen so far; a later record for one is a duplicate
+    seen = set()
+    started = time.perf_counter()
+    try:
+        db.ensure_engine()
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            for batch in batches(read_records(args.path), args.batch_size):
+                valid = []
+                for record in batch:
+                    problem = validate(record)
+                    if problem:
+                        invalid += 1
+                        print(f"   ⚠️  {record.get('mobile_no')}: {problem}", file=sys.stderr)
+                    elif record["mobile_no"] in seen:
+                        duplicates += 1
+                        print(f"   {record['mobile_no']}: repeated in the input, skipped", file=sys.stderr)
+                    else:
+                        seen.add(record["mobile_no"])
+                        valid.append(record)
+                if not valid:
+                    continue
+                hashes = pool.map(hash_password, [r["password"] for r in valid], chunksize=16)
+                rows = [new_profile_row(r, h) for r, h in zip(valid, hashes)]
+                with db.Engine.begin() as conn:
+                    inserted = {m for _, m in conn.execute(bulk_insert_statement(rows))}
+                created += len(inserted)
+                for row in rows:
+                    if row["mobile_no"] not in inserted:
+                        skipped += 1
+                        print(f"   {row['mobile_no']}: already registered, skipped", file=sys.stderr)
+                elapsed = time.perf_counter() - started
+                print(f"   {created} created, {skipped} skipped, {duplicates} duplicates, {invalid} invalid "
+                      f"({elapsed:.1f}s)", file=sys.stderr)
+    except Exception as e:
+        print(f"❌ Onboarding failed: {e}")
+        sys.exit(1)
+    finally:
+        if db.Engine is not None:
+            db.Engine.dispose()
+
+    print(f"✅ {created} accounts created, {skipped} already registered, {duplicates} duplicates, {invalid} invalid")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+Bulk export/import of user_profiles in bounded memory.
+
+Exports stream through a server-side cursor (or COPY for CSV) and imports go
+through COPY into a temp table followed by INSERT ... ON CONFLICT DO NOTHING,
+one batch at a time. Parquet needs pyarrow installed.
+
+Each profile's user_profile_photos row travels with it as two extra fields,
+photo_mime_type and base64 photo_data; only profiles the import actually
+inserts get their photo. --exclude-photos leaves photos out altogether, so
+imported profiles have no profile_photo_url.
+
+    python scripts/profiles_bulk.py export profiles.ndjson
+    python scripts/profiles_bulk.py export profiles.csv --exclude-photos
+    python scripts/profiles_bulk.py import profiles.parquet --batch-size 5000
+"""
+
+import argparse
+import csv
+import datetime
+import decimal
+import json
+import os
+import sys
+import time
+import uuid
+
+import psycopg
+from psycopg import sql
+from sqlalchemy import Numeric, TIMESTAMP
+
+# Add the backend directory to Python path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from common.config import get_settings
+from common.db import libpq_url
+from common.models import UserProfile
+
+PHOTO_COLUMNS = {"profile_photo_url", "profile_photo_data", "profile_photo_mime_type"}
+# user_profile_photos fields carried on each exported profile
+PHOTO_FIELDS = ["photo_mime_type", "photo_data"]
+FORMATS = {".ndjson": "ndjson", ".jsonl": "ndjson", ".csv": "csv", ".parquet": "parquet"}
+
+
+def connect() -> psycopg.Connection:
+    s = get_settings()
+    if not s.database_url:
+        print("❌ DATABASE_URL not configured")
+        sys.exit(1)
+    # Like the app's engines, don't prepare statements through a transaction pooler
+    return psycopg.connect(libpq_url(s.database_url), prepare_threshold=None if s.db_pgbouncer else 5)
+
+
+def columns_for(exclude_photos: bool) -> list[str]:
+    # geo_cell is derived from the coordinates by a trigger on insert
+    cols = [c.name for c in UserProfile.__table__.columns if c.name != "geo_cell"]
+    if exclude_photos:
+        cols = [c for c in cols if c not in PHOTO_COLUMNS]
+    return cols
+
+
+def export_fields(exclude_photos: bool) -> list[str]:
+    return columns_for(exclude_photos) + ([] if exclude_photos else PHOTO_FIELDS)
+
+
+def export_query(exclude_photos: bool) -> sql.Composed:
+    fields = [sql.SQL("p.{}").format(sql.Identifier(c)) for c in columns_for(exclude_photos)]
+    source = sql.SQL("user_profiles p")
+    if not exclude_photos:
+        fields += [
+            sql.SQL("ph.mime_type AS photo_mime_type"),
+            # encode() wraps at 76 characters; keep each photo on one line
+            sql.SQL("translate(encode(ph.data, 'base64'), E'\\n', '') AS photo_data"),
+        ]
+        source = sql.SQL("user_profiles p LEFT JOIN user_profile_photos ph ON ph.user_id = p.id")
+    return sql.SQL("SELECT {} FROM {} ORDER BY p.id").format(sql.SQL(", ").join(fields), source)
+
+
+class Progress:
+    def __init__(self, label: str, every: int):
+        self.label = label
+        self.every = every
+        self.rows = 0
+        self.started = time.perf_counter()
+        self._next = every
+
+    def add(self, n: int):
+        self.rows += n
+        if self.rows >= self._next:
+            self._report()
+            self._next = self.rows + self.every
+
+    def _report(self, final=False):
+        elapsed = time.perf_counter() - self.started
+        rate = self.rows / elapsed if elapsed > 0 else 0.0
+        prefix = "✅" if final else "  "
+        print(f"{prefix} {self.label}: {self.rows} rows in {elapsed:.1f}s ({rate:,.0f} rows/s)", file=sys.stderr)
+
+    def done(self):
+        self._report(final=True)
+
+
+def _jsonable(value):
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    return value
+
+
+# --- export -----------------------------------------------------------------
+
+def export_csv(conn, path: str, query: sql.Composed, progress: Progress):
+    query = sql.SQL("COPY ({}) TO STDOUT WITH (FORMAT csv, HEADER true)").format(query)
+    with open(path, "wb") as out, conn.cursor() as cur:
+        with cur.copy(query) as copy:
+            for chunk in copy:
+                out.write(chunk)
+                # Line count is only an estimate while streaming (quoted newlines)
+                progress.add(bytes(chunk).count(b"\n"))
+        progress.rows = cur.rowcount
+
+
+def _stream_rows(conn, query: sql.Composed, batch_size: int):
+    # Named cursor = server-side; only batch_size rows are held client-side
+    with conn.cursor(name="profiles_export") as cur:
+        cur.itersize = batch_size
+        cur.execute(query)
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
+
+
+def export_ndjson(conn, path: str, query: sql.Composed, cols: list[str], batch_size: int, progress: Progress):
+    with open(path, "w", encoding="utf-8") as out:
+        for rows in _stream_rows(conn, query, batch_size):
+            out.writelines(
+                json.dumps({c: _jsonable(v) for c, v in zip(cols, row)}, separators=(",", ":")) + "\n"
+                for row in rows
+            )
+            progress.add(len(rows))
+
+
+def export_parquet(conn, path: str, query: sql.Composed, cols: list[str], batch_size: int, progress: Progress):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    # Fixed schema so an all-NULL first batch can't pin a column to the null type
+    types = {c.name: c.type for c in UserProfile.__table__.columns}
+    schema = pa.schema([
+        (c, pa.float64() if isinstance(types.get(c), Numeric)
+         else pa.timestamp("us") if isinstance(types.get(c), TIMESTAMP)
+         else pa.string())
+        for c in cols
+    ])
+    with pq.ParquetWriter(path, schema) as writer:
+        for rows in _stream_rows(conn, query, batch_size):
+            columns = list(zip(*rows))
+            arrays = [
+                pa.array([v if isinstance(v, datetime.datetime) else _jsonable(v) for v in columns[i]], type=field.type)
+                for i, field in enumerate(schema)
+            ]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            progress.add(len(rows))
+
+
+# --- import -----------------------------------------------------------------
+
+def read_ndjson(path: str, batch_size: int):
+    batch = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                batch.append(json.loads(line))
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+    if batch:
+        yield batch
+
+
+def read_csv(path: str, batch_size: int):
+    batch = []
+    with open(path, newline="", encoding="utf-8") as f:
+        for record in csv.DictReader(f):
+            # COPY csv writes NULL as an empty unquoted field
+            batch.append({k: (v if v != "" else None) for k, v in record.items()})
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def read_parquet(path: str, batch_size: int):
+    import pyarrow.parquet as pq
+
+    for record_batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size):
+        yield record_batch.to_pylist()
+
+
+def import_batches(conn, batches, exclude_photos: bool, progress: Progress) -> tuple[int, int]:
+    known = set(export_fields(exclude_photos))
+    inserted = photos = 0
+    with conn.cursor() as cur:
+        cur.execute(
+            "CREATE TEMP TABLE profiles_import "
+            "(LIKE user_profiles INCLUDING DEFAULTS, photo_mime_type VARCHAR(50), photo_data TEXT) "
+            "ON COMMIT DELETE ROWS"
+        )
+        conn.commit()
+        for batch in batches:
+            fields = [c for c in batch[0] if c in known]
+            cols = [c for c in fields if c not in PHOTO_FIELDS]
+            with cur.copy(sql.SQL("COPY profiles_import ({}) FROM STDIN").format(
+                sql.SQL(", ").join(map(sql.Identifier, fields))
+            )) as copy:
+                for record in batch:
+                    copy.write_row([_copy_value(record.get(c)) for c in fields])
+            # Photos only for profiles inserted here, never onto an existing one
+            cur.execute(
+                sql.SQL(
+                    "WITH inserted AS ("
+                    "INSERT INTO user_profiles ({cols}) SELECT {cols} FROM profiles_import "
+                    "ON CONFLICT DO NOTHING RETURNING id), "
+                    "photos AS ("
+                    "INSERT INTO user_profile_photos (user_id, data, mime_type, sha256, size) "
+                    "SELECT id, data, mime_type, encode(sha256(data), 'hex'), length(data) FROM ("
+                    "SELECT i.id, decode(i.photo_data, 'base64') AS data, i.photo_mime_type AS mime_type "
+                    "FROM profiles_import i JOIN inserted ON inserted.id = i.id "
+                    "WHERE i.photo_data IS NOT NULL) decoded "
+                    "RETURNING 1) "
+                    "SELECT (SELECT count(*) FROM inserted), (SELECT count(*) FROM photos)"
+                ).format(cols=sql.SQL(", ").join(map(sql.Identifier, cols)))
+            )
+            batch_inserted, batch_photos = cur.fetchone()
+            inserted += batch_inserted
+            photos += batch_photos
+            conn.commit()
+            progress.add(len(batch))
+    return inserted, photos
+
+
+def _copy_value(value):
+    # Let the server parse everything from text; COPY handles the casts
+    if value is None:
+        return None
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return str(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk export/import of user_profiles")
+    parser.add_argument("command", choices=["export", "import"])
+    parser.add_argument("path", help="File to write/read; format from extension (.ndjson/.jsonl, .csv, .parquet)")
+    parser.add_argument("--format", choices=sorted(set(FORMATS.values())), help="Override format detection")
+    parser.add_argument("--batch-size", type=int, default=2000)
+    parser.add_argument("--exclude-photos", action="store_true",
+                        help="Leave out photos and the profile_photo_* columns")
+    parser.add_argument("--progress-every", type=int, default=10000, help="Report every N rows")
+    args = parser.parse_args()
+
+    fmt = args.format or FORMATS.get(os.path.splitext(args.path)[1].lower())
+    if fmt is None:
+        parser.error("cannot infer format from file extension; pass --format")
+
+    progress = Progress(f"{args.command} {fmt}", args.progress_every)
+    try:
+        with connect() as conn:
+            if args.command == "export":
+                query = export_query(args.exclude_photos)
+                fields = export_fields(args.exclude_photos)
+                if fmt == "csv":
+                    export_csv(conn, args.path, query, progress)
+                elif fmt == "ndjson":
+                    export_ndjson(conn, args.path, query, fields, args.batch_size, progress)
+                else:
+                    export_parquet(conn, args.path, query, fields, args.batch_size, progress)
+                progress.done()
+            else:
+                readers = {"ndjson": read_ndjson, "csv": read_csv, "parquet": read_parquet}
+                batches = readers[fmt](args.path, args.batch_size)
+                inserted, photos = import_batches(conn, batches, args.exclude_photos, progress)
+                progress.done()
+                print(f"   inserted {inserted} ({photos} with photos), skipped {progress.rows - inserted} existing",
+                      file=sys.stderr)
+    except ImportError as e:
+        print(f"❌ {fmt} support needs an extra package: {e}")
+        sys.exit(1)
+    except Exception as e:
+        print(f"❌ {args.command} failed: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
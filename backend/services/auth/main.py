@@ -1,11 +1,23 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from .router import router
-import logging
+from common.security import password_hasher
+from common.db import database_lifespan
+from common.log import configure_logging, RequestIdMiddleware
 
 
-logging.basicConfig(level=logging.INFO)
-app = FastAPI()
+configure_logging()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    async with database_lifespan():
+        yield
+    password_hasher.shutdown()
+
+
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -14,4 +26,5 @@ app.add_middleware(
     ,
     allow_headers=["*"]
 )
+app.add_middleware(RequestIdMiddleware)
 app.include_router(router, prefix="/auth")
@@ -1,34 +1,59 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
 from pydantic import BaseModel, Field
 from typing import Literal
-from sqlalchemy.orm import Session
+from sqlalchemy import select, update, bindparam
+from sqlalchemy.ext.asyncio import AsyncSession
 from time import time
+import base64
+import binascii
 import random
 import logging
-from common.db import SessionLocal, ensure_engine
+from common.config import get_settings
+from common.db import get_db
+from common.otp_store import create_otp_store
+from common.images import generate_profile_photo_variants, variants_available, sniff_image_type
 from common.models import UserProfile
-from common.security import hash_password, verify_password, create_access_token
+from common.accounts import new_profile_row, attach_photo, register_statement
+from common.replicas import mark_written
+from common.security import password_hasher, PasswordHashingBusy, create_access_token
+from common.responses import FastJSONResponse
+from common.rate_limit import RateLimit
 
 
-router = APIRouter()
+router = APIRouter(default_response_class=FastJSONResponse)
+logger = logging.getLogger(__name__)
 
 
-def get_db():
-    ensure_engine()
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+otp_store = create_otp_store(get_settings())
+
+# Auth paths read a few Core columns instead of the ORM entity: no identity
+# map, no photo or profile columns. Built once so every call reuses the
+# same cached compiled SQL.
+_profiles = UserProfile.__table__
+CREDENTIALS_BY_MOBILE = (
+    select(_profiles.c.id, _profiles.c.password, _profiles.c.category)
+    .where(_profiles.c.mobile_no == bindparam("mobile_no"))
+)
+MOBILE_TAKEN = select(_profiles.c.id).where(_profiles.c.mobile_no == bindparam("mobile_no"))
+UPDATE_PASSWORD = update(_profiles).where(_profiles.c.id == bindparam("user_id")).values(password=bindparam("password"))
 
+_s = get_settings()
+send_otp_limit = RateLimit("send-otp", mobile=_s.rate_limit_send_otp_mobile, ip=_s.rate_limit_send_otp_ip)
+login_limit = RateLimit("login", mobile=_s.rate_limit_login_mobile, ip=_s.rate_limit_login_ip)
 
-otp_store: dict[str, tuple[str, float]] = {}
+
+def _hashing_busy(exc: PasswordHashingBusy) -> HTTPException:
+    return HTTPException(status_code=503, detail="auth_busy", headers={"Retry-After": str(exc.retry_after)})
 
 
 class SendOtpRequest(BaseModel):
     mobile_no: str
 
 
+class SendOtpResponse(BaseModel):
+    sent: bool
+
+
 class RegisterRequest(BaseModel):
     full_name: str
     mobile_no: str
@@ -44,7 +69,7 @@ class RegisterRequest(BaseModel):
     longitude: float | None = None
     profile_photo_url: str | None = None
     profile_photo_data: str | None = None  # Base64 encoded image data
-    profile_photo_mime_type: str | None = None  # e.g., 'image/jpeg', 'image/png'
+    profile_photo_mime_type: Literal['image/jpeg', 'image/png', 'image/webp'] | None = None
     otp_code: str = Field(min_length=4)
 
 
@@ -53,105 +78,108 @@ class LoginRequest(BaseModel):
     password: str
 
 
-@router.post("/send-otp")
-def send_otp(payload: SendOtpRequest):
+class RegisterResponse(BaseModel):
+    id: str
+    mobile_no: str
+
+
+class LoginResponse(BaseModel):
+    access_token: str
+    token_type: str
+    category: str
+
+
+@router.post("/send-otp", response_model=SendOtpResponse, dependencies=[Depends(send_otp_limit)])
+async def send_otp(payload: SendOtpRequest):
     code = f"{random.randint(100000, 999999)}"
-    expiry = time() + 300
-    otp_store[payload.mobile_no] = (code, expiry)
-    logging.info(f"OTP for {payload.mobile_no}: {code}")
+    await otp_store.put(payload.mobile_no, code, get_settings().otp_expiry_seconds)
+    logger.info("OTP for %s: %s", payload.mobile_no, code)
     return {"sent": True}
 
 
-@router.post("/register")
-def register(payload: RegisterRequest, db: Session = Depends(get_db)):
-    logging.info(f"Registration attempt for mobile: {payload.mobile_no}")
-    
-    stored = otp_store.get(payload.mobile_no)
+@router.post("/register", response_model=RegisterResponse)
+async def register(payload: RegisterRequest, background_tasks: BackgroundTasks, db: AsyncSession = Depends(get_db)):
+    stored = await otp_store.get(payload.mobile_no)
     if not stored:
-        logging.warning(f"OTP not found for mobile: {payload.mobile_no}")
+        logger.warning("OTP not found for mobile: %s", payload.mobile_no)
         raise HTTPException(status_code=400, detail="otp_required")
     
     code, expiry = stored
     if time() > expiry:
-        del otp_store[payload.mobile_no]
-        logging.warning(f"OTP expired for mobile: {payload.mobile_no}")
+        await otp_store.delete(payload.mobile_no)
+        logger.warning("OTP expired for mobile: %s", payload.mobile_no)
         raise HTTPException(status_code=400, detail="otp_expired")
     
     if payload.otp_code != code:
-        logging.warning(f"Invalid OTP for mobile: {payload.mobile_no}. Expected: {code}, Got: {payload.otp_code}")
+        logger.warning("Invalid OTP for mobile: %s", payload.mobile_no)
         raise HTTPException(status_code=400, detail="otp_invalid")
     
-    logging.info(f"OTP validation successful for mobile: {payload.mobile_no}")
-    
-    existing = db.query(UserProfile).filter(UserProfile.mobile_no == payload.mobile_no).first()
-    if existing:
-        logging.warning(f"Mobile number already exists: {payload.mobile_no}")
-        raise HTTPException(status_code=400, detail="mobile_exists")
-    
-    logging.info(f"No existing user found for mobile: {payload.mobile_no}")
-    
-    hashed = hash_password(payload.password)
-    logging.info(f"Password hashed successfully for mobile: {payload.mobile_no}")
-    
-    obj = UserProfile(
-        full_name=payload.full_name,
-        mobile_no=payload.mobile_no,
-        password=hashed,
-        gender=payload.gender,
-        category=payload.category,
-        address_line=payload.address_line,
-        city=payload.city,
-        state=payload.state,
-        country=payload.country,
-        pincode=payload.pincode,
-        latitude=payload.latitude,
-        longitude=payload.longitude,
-        profile_photo_url=payload.profile_photo_url,
-    )
-    
-    # Handle profile photo data if provided
+    photo_data = None
     if payload.profile_photo_data and payload.profile_photo_mime_type:
         try:
-            # Decode base64 data and store in database
-            import base64
-            image_data = base64.b64decode(payload.profile_photo_data)
-            obj.set_profile_photo(image_data, payload.profile_photo_mime_type)
-            logging.info(f"Profile photo stored in database for mobile: {payload.mobile_no}")
-        except Exception as e:
-            logging.error(f"Failed to process profile photo for mobile: {payload.mobile_no}: {e}")
-            # Continue with registration even if photo processing fails
-    
-    logging.info(f"Creating user object for mobile: {payload.mobile_no}")
-    
+            photo_data = base64.b64decode(payload.profile_photo_data, validate=True)
+        except binascii.Error:
+            raise HTTPException(status_code=400, detail="invalid_photo")
+        # The stored type is served back as Content-Type, so it must match the bytes
+        if sniff_image_type(photo_data) != payload.profile_photo_mime_type:
+            logger.warning("Photo is not %s for mobile: %s", payload.profile_photo_mime_type, payload.mobile_no)
+            raise HTTPException(status_code=400, detail="invalid_photo")
+
+    # Cheap check before Argon2, so re-registering a taken number can't tie
+    # up the hashing pool; the insert below still settles races
+    if await db.scalar(MOBILE_TAKEN, {"mobile_no": payload.mobile_no}) is not None:
+        logger.warning("Mobile number already exists: %s", payload.mobile_no)
+        raise HTTPException(status_code=400, detail="mobile_exists")
+
+    try:
+        hashed = await password_hasher.hash(payload.password)
+    except PasswordHashingBusy as e:
+        raise _hashing_busy(e)
+
+    row = new_profile_row(payload.model_dump(), hashed)
+    photo = None
+    if photo_data is not None:
+        photo = attach_photo(row, photo_data, payload.profile_photo_mime_type)
+
     try:
-        db.add(obj)
-        logging.info(f"User object added to session for mobile: {payload.mobile_no}")
-        
-        db.commit()
-        logging.info(f"Database commit successful for mobile: {payload.mobile_no}")
-        
-        db.refresh(obj)
-        logging.info(f"User object refreshed from database for mobile: {payload.mobile_no}")
-        
-        del otp_store[payload.mobile_no]
-        logging.info(f"OTP removed from store for mobile: {payload.mobile_no}")
-        
-        logging.info(f"Registration successful for mobile: {payload.mobile_no}, user_id: {obj.id}")
-        return {"id": str(obj.id), "mobile_no": obj.mobile_no}
-        
+        # Insert, duplicate check and id in one round trip (plus the commit)
+        user_id = await db.scalar(register_statement(row, photo))
+        await db.commit()
     except Exception as e:
-        logging.error(f"Database error during registration for mobile: {payload.mobile_no}, error: {str(e)}")
-        db.rollback()
-        logging.error(f"Database rollback executed for mobile: {payload.mobile_no}")
+        logger.error("Database error during registration for mobile: %s, error: %s", payload.mobile_no, e)
+        await db.rollback()
         raise HTTPException(status_code=500, detail="database_error")
 
+    if user_id is None:
+        logger.warning("Mobile number already exists: %s", payload.mobile_no)
+        raise HTTPException(status_code=400, detail="mobile_exists")
+
+    mark_written(user_id)
+    await otp_store.delete(payload.mobile_no)
+    if photo is not None and variants_available():
+        # Thumbnails are rendered after the response; the original is served until then
+        background_tasks.add_task(generate_profile_photo_variants, user_id, photo["sha256"], photo["data"])
 
-@router.post("/login")
-def login(payload: LoginRequest, db: Session = Depends(get_db)):
-    obj = db.query(UserProfile).filter(UserProfile.mobile_no == payload.mobile_no).first()
-    if not obj:
+    logger.info("Registered user %s for mobile: %s", user_id, payload.mobile_no)
+    return {"id": str(user_id), "mobile_no": payload.mobile_no}
+
+
+@router.post("/login", response_model=LoginResponse, dependencies=[Depends(login_limit)])
+async def login(payload: LoginRequest, db: AsyncSession = Depends(get_db)):
+    result = await db.execute(CREDENTIALS_BY_MOBILE, {"mobile_no": payload.mobile_no})
+    creds = result.first()
+    if not creds:
         raise HTTPException(status_code=400, detail="invalid_credentials")
-    if not verify_password(payload.password, obj.password):
+    user_id, password, category = creds
+    try:
+        ok, new_hash = await password_hasher.verify_and_update(payload.password, password)
+    except PasswordHashingBusy as e:
+        raise _hashing_busy(e)
+    if not ok:
         raise HTTPException(status_code=400, detail="invalid_credentials")
-    token = create_access_token(str(obj.id), obj.category)
-    return {"access_token": token, "token_type": "bearer", "category": obj.category}
+    if new_hash:
+        # Stored hash predates the current Argon2 parameters
+        await db.execute(UPDATE_PASSWORD, {"user_id": user_id, "password": new_hash})
+        await db.commit()
+    token = create_access_token(str(user_id), category)
+    return {"access_token": token, "token_type": "bearer", "category": category}
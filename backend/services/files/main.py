@@ -1,10 +1,21 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from .router import router
+from .router import router, UPLOAD_DIR
+from .static import UploadStaticFiles
+from common.images import image_pool
+from common.db import database_lifespan
+import os
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    async with database_lifespan():
+        yield
+    image_pool.shutdown()
+
+
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -13,4 +24,5 @@ app.add_middleware(
     allow_headers=["*"],
 )
 app.include_router(router, prefix="/files")
-app.mount("/files/static", StaticFiles(directory="backend/uploads"), name="files-static")
+os.makedirs(UPLOAD_DIR, exist_ok=True)
+app.mount("/files/static", UploadStaticFiles(directory=UPLOAD_DIR), name="files-static")
@@ -1,21 +1,95 @@
+import hashlib
 import os
-import uuid
-from fastapi import APIRouter, UploadFile, File, HTTPException
+import tempfile
+from fastapi import APIRouter, UploadFile, File, HTTPException, Request, BackgroundTasks
+from fastapi.routing import APIRoute
+from pydantic import BaseModel
+from starlette.concurrency import run_in_threadpool
+from common.config import get_settings, UPLOAD_TMP_DIR
+from common.images import image_pool, variants_available
+from common.responses import FastJSONResponse
 
 
-router = APIRouter()
-UPLOAD_DIR = os.path.join("backend", "uploads")
+UPLOAD_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "uploads")
+CHUNK_SIZE = 1024 * 1024
+# Multipart framing around the file part
+MULTIPART_OVERHEAD = 64 * 1024
+ALLOWED_EXTENSIONS = {".jpg": ".jpg", ".jpeg": ".jpg", ".png": ".png", ".webp": ".webp"}
 
 
-@router.post("/upload")
-async def upload(file: UploadFile = File(...)):
+class UploadLimitRoute(APIRoute):
+    """Rejects oversized uploads from Content-Length before the multipart
+    body is read and spooled."""
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def limited_handler(request: Request):
+            content_length = request.headers.get("content-length")
+            if content_length and content_length.isdigit():
+                if int(content_length) > get_settings().upload_max_bytes + MULTIPART_OVERHEAD:
+                    raise HTTPException(status_code=413, detail="file_too_large")
+            return await handler(request)
+
+        return limited_handler
+
+
+router = APIRouter(route_class=UploadLimitRoute, default_response_class=FastJSONResponse)
+
+
+class UploadResponse(BaseModel):
+    url: str
+
+
+def _write_chunk(tmp, digest, chunk: bytes):
+    digest.update(chunk)
+    tmp.write(chunk)
+
+
+def _commit_upload(tmp_path: str, path: str) -> bool:
+    """Returns False when the same content is already stored under its hash"""
+    if os.path.exists(path):
+        os.unlink(tmp_path)
+        return False
+    os.replace(tmp_path, path)
+    return True
+
+
+@router.post("/upload", response_model=UploadResponse)
+async def upload(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
     os.makedirs(UPLOAD_DIR, exist_ok=True)
+    os.makedirs(UPLOAD_TMP_DIR, exist_ok=True)
     ext = os.path.splitext(file.filename or "")[1].lower()
-    if ext not in {".jpg", ".jpeg", ".png", ".webp"}:
+    if ext not in ALLOWED_EXTENSIONS:
         raise HTTPException(status_code=400, detail="unsupported_file_type")
-    name = f"{uuid.uuid4()}{ext}"
-    path = os.path.join(UPLOAD_DIR, name)
-    content = await file.read()
-    with open(path, "wb") as f:
-        f.write(content)
+    ext = ALLOWED_EXTENSIONS[ext]
+    max_bytes = get_settings().upload_max_bytes
+
+    # Stream to a temp file outside the served directory, hashing as we go.
+    # Disk I/O stays off the event loop.
+    fd, tmp_path = tempfile.mkstemp(dir=UPLOAD_TMP_DIR, suffix=".part")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as tmp:
+            while True:
+                chunk = await file.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise HTTPException(status_code=413, detail="file_too_large")
+                await run_in_threadpool(_write_chunk, tmp, digest, chunk)
+        if size == 0:
+            raise HTTPException(status_code=400, detail="empty_file")
+        name = f"{digest.hexdigest()}{ext}"
+        path = os.path.join(UPLOAD_DIR, name)
+        created = await run_in_threadpool(_commit_upload, tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    if created and variants_available():
+        # Rendered after the response is sent; ?size= falls back to the original meanwhile
+        background_tasks.add_task(image_pool.render_files, path)
     return {"url": f"/files/static/{name}"}
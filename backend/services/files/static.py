@@ -0,0 +1,172 @@
+import os
+import stat
+from collections import OrderedDict
+from mimetypes import guess_type
+from urllib.parse import parse_qs
+from fastapi import HTTPException
+from fastapi.staticfiles import StaticFiles
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from common.config import get_settings
+from common.metrics import CallbackGauge
+from common.images import variants_available, pick_variant_size, negotiate_format, variant_name
+
+
+# Upload names are content hashes (or random UUIDs for old uploads), so a
+# given URL never changes content
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+
+# Every mount's cache, for the metrics below
+_file_caches = []
+
+
+def _file_cache_samples() -> dict:
+    return {
+        ("bytes",): sum(c.size for c in _file_caches),
+        ("hits",): sum(c.hits for c in _file_caches),
+        ("misses",): sum(c.misses for c in _file_caches),
+    }
+
+
+CallbackGauge(
+    "static_file_cache", "Hot upload cache size, and lookups since start", ("stat",), _file_cache_samples,
+)
+
+
+class HotFileCache:
+    """Byte-budgeted LRU of small, immutable upload files"""
+
+    def __init__(self, max_bytes: int, max_file_bytes: int):
+        self.max_bytes = max_bytes
+        self.max_file_bytes = max_file_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, tuple[bytes, str]] = OrderedDict()
+        _file_caches.append(self)
+
+    def __contains__(self, path: str) -> bool:
+        return path in self._entries
+
+    def get(self, path: str) -> tuple[bytes, str] | None:
+        entry = self._entries.get(path)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(path)
+        self.hits += 1
+        return entry
+
+    def put(self, path: str, data: bytes, media_type: str):
+        if len(data) > self.max_file_bytes or path in self._entries:
+            return
+        self._entries[path] = (data, media_type)
+        self.size += len(data)
+        while self.size > self.max_bytes:
+            _, (evicted, _) = self._entries.popitem(last=False)
+            self.size -= len(evicted)
+
+
+class UploadFileResponse(FileResponse):
+    """FileResponse that keeps the caller's ETag for If-Range and hands the
+    body to the server as a path when it supports zero-copy sending."""
+
+    _pathsend = False
+
+    def _should_use_range(self, http_if_range: str, stat_result: os.stat_result) -> bool:
+        return http_if_range == self.headers.get("etag")
+
+    async def __call__(self, scope, receive, send):
+        self._pathsend = "http.response.pathsend" in scope.get("extensions", {})
+        await super().__call__(scope, receive, send)
+
+    async def _handle_simple(self, send, send_header_only: bool) -> None:
+        if send_header_only or not self._pathsend:
+            return await super()._handle_simple(send, send_header_only)
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        await send({"type": "http.response.pathsend", "path": os.fspath(self.path)})
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+class UploadStaticFiles(StaticFiles):
+    """Serves the uploads directory.
+
+    Responses carry immutable caching and a strong ETag derived from the
+    file name. Small files are kept in an in-memory LRU, byte ranges are
+    supported, and ``?size=N`` (optionally ``format=webp|jpeg``) serves the
+    smallest pre-rendered variant covering N pixels, or the original if it
+    is not rendered yet.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        s = get_settings()
+        self.cache = HotFileCache(s.static_cache_max_bytes, s.static_cache_max_file_bytes)
+
+    async def _resolve_variant(self, path: str, scope) -> tuple[str, bool, bool]:
+        """Returns (path to serve, negotiated on Accept, fell back to original)"""
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        size = query.get("size", [""])[0]
+        if not size.isdigit() or not variants_available():
+            return path, False, False
+        target = pick_variant_size(int(size))
+        if target is None:
+            return path, False, False
+        accept = Headers(scope=scope).get("accept")
+        fmt = negotiate_format(query.get("format", [None])[0], accept)
+        candidate = variant_name(path, target, fmt)
+        if candidate in self.cache or await run_in_threadpool(os.path.isfile, os.path.join(self.directory, candidate)):
+            return candidate, True, False
+        return path, True, True
+
+    async def _lookup(self, path: str):
+        try:
+            full_path, stat_result = await run_in_threadpool(self.lookup_path, path)
+        except OSError:
+            raise HTTPException(status_code=404)
+        if not stat_result or not stat.S_ISREG(stat_result.st_mode):
+            raise HTTPException(status_code=404)
+        return full_path, stat_result
+
+    async def get_response(self, path: str, scope):
+        if scope["method"] not in ("GET", "HEAD"):
+            raise HTTPException(status_code=405)
+
+        path, negotiated, fallback = await self._resolve_variant(path, scope)
+        headers = {
+            # Full name, extension included: negotiated variants of one size
+            # (.webp, .jpeg) must not share a validator
+            "ETag": f'"{os.path.basename(path)}"',
+            # The variant isn't rendered yet; the original must not be cached in its place
+            "Cache-Control": "public, no-cache" if fallback else IMMUTABLE,
+        }
+        if negotiated:
+            headers["Vary"] = "Accept"
+        request_headers = Headers(scope=scope)
+        ranged = "range" in request_headers
+
+        cached = self.cache.get(path)
+        full_path = stat_result = None
+        if cached is None or ranged:
+            full_path, stat_result = await self._lookup(path)
+
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match and headers["ETag"] in [tag.strip(" W/") for tag in if_none_match.split(",")]:
+            return Response(status_code=304, headers=headers)
+
+        if not ranged:
+            if cached is None and stat_result.st_size <= self.cache.max_file_bytes:
+                data = await run_in_threadpool(_read_file, full_path)
+                media_type = guess_type(path)[0] or "application/octet-stream"
+                self.cache.put(path, data, media_type)
+                cached = (data, media_type)
+            if cached is not None:
+                return Response(content=cached[0], media_type=cached[1], headers=headers)
+
+        return UploadFileResponse(full_path, stat_result=stat_result, headers=headers)
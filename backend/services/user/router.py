@@ -1,34 +1,66 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
-from common.db import SessionLocal, ensure_engine
-from common.models import UserProfile
+from pydantic import BaseModel, Field
+from jose import JWTError
+from sqlalchemy import select, between, case, cast, func, tuple_, union_all, String
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Literal
+from uuid import UUID
+import base64
+import binascii
+import hashlib
+import json
+import numpy as np
+from common.config import get_settings
+from common.replicas import get_read_db
+from common.models import UserProfile, UserProfilePhoto, UserProfilePhotoVariant, PHOTO_VERSION_LENGTH
+from common.images import PHOTO_MIME_TYPES, VARIANT_FORMATS, variants_available, pick_variant_size, negotiate_format
 from common.security import decode_token
+from common.profile_cache import profile_cache
+from common.geo import bounding_box, cover_cells, haversine_km
+from common.responses import FastJSONResponse
 
 
-router = APIRouter()
+router = APIRouter(default_response_class=FastJSONResponse)
 security = HTTPBearer()
 
+# Categories other users can discover; customers are never listed
+MERCHANT_CATEGORIES = ('Vendor', 'Women Merchant')
 
-def get_db():
-    ensure_engine()
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
 
+def _photo_url_column():
+    """profile_photo_url, with legacy inline data: URIs swapped for the photo
+    route in SQL so the image never leaves the database"""
+    url = UserProfile.profile_photo_url
+    return case(
+        (url.like("data:%"), func.concat("/user/", cast(UserProfile.id, String), "/photo")),
+        else_=url,
+    ).label("profile_photo_url")
 
-@router.get("/me")
-def me(creds: HTTPAuthorizationCredentials = Depends(security), db: Session = Depends(get_db)):
-    data = decode_token(creds.credentials)
+
+def _current_user_id(creds: HTTPAuthorizationCredentials) -> str:
+    try:
+        data = decode_token(creds.credentials)
+    except JWTError:
+        raise HTTPException(status_code=401, detail="invalid_token")
     uid = data.get("sub")
     if not uid:
         raise HTTPException(status_code=401, detail="invalid_token")
-    obj = db.query(UserProfile).filter(UserProfile.id == uid).first()
+    return uid
+
+
+@router.get("/me")
+async def me(creds: HTTPAuthorizationCredentials = Depends(security), db: AsyncSession = Depends(get_read_db)):
+    uid = _current_user_id(creds)
+    cached = profile_cache.get(uid)
+    if cached is not None:
+        return Response(content=cached, media_type="application/json")
+    cache_version = profile_cache.version
+    result = await db.execute(select(UserProfile).where(UserProfile.id == uid))
+    obj = result.scalars().first()
     if not obj:
         raise HTTPException(status_code=404, detail="not_found")
-    return {
+    content = json.dumps({
         "id": str(obj.id),
         "full_name": obj.full_name,
         "mobile_no": obj.mobile_no,
@@ -41,7 +73,348 @@ def me(creds: HTTPAuthorizationCredentials = Depends(security), db: Session = De
         "pincode": obj.pincode,
         "latitude": float(obj.latitude) if obj.latitude is not None else None,
         "longitude": float(obj.longitude) if obj.longitude is not None else None,
-        "profile_photo_url": obj.profile_photo_url,
-        "profile_photo_data": obj.profile_photo_data,  # Base64 encoded image data
+        "profile_photo_url": obj.public_photo_url(),
         "profile_photo_mime_type": obj.profile_photo_mime_type,
-    }
+    }, separators=(",", ":")).encode()
+    profile_cache.put(uid, content, cache_version)
+    return Response(content=content, media_type="application/json")
+
+
+def _encode_cursor(*key) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> tuple[float, str]:
+    try:
+        distance, user_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return float(distance), str(user_id)
+    except (binascii.Error, ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="invalid_cursor")
+
+
+async def _nearest(db, lat, lon, radius_km, categories, after, limit):
+    """Up to limit (distance, id) pairs within radius_km ordered after the
+    cursor, plus whether more exist. Only ids and coordinates are loaded."""
+    box = bounding_box(lat, lon, radius_km)
+    query = select(UserProfile.id, UserProfile.latitude, UserProfile.longitude).where(
+        UserProfile.category.in_(categories),
+        between(UserProfile.latitude, box[0], box[1]),
+        between(UserProfile.longitude, box[2], box[3]),
+    )
+    cells = cover_cells(box)
+    if cells is not None:
+        query = query.where(UserProfile.geo_cell.in_(cells))
+    rows = (await db.execute(query)).all()
+    if not rows:
+        return [], False
+
+    ids = np.array([str(r[0]) for r in rows])
+    coords = np.array([(r[1], r[2]) for r in rows], dtype=np.float64)
+    distances = haversine_km(lat, lon, coords[:, 0], coords[:, 1])
+    keep = distances <= radius_km
+    if after is not None:
+        keep &= (distances > after[0]) | ((distances == after[0]) & (ids > after[1]))
+    ids, distances = ids[keep], distances[keep]
+    order = np.lexsort((ids, distances))[:limit + 1]
+    page = [(float(distances[i]), str(ids[i])) for i in order]
+    return page[:limit], len(page) > limit
+
+
+class NearbyProfile(BaseModel):
+    id: str
+    full_name: str
+    category: str
+    city: str | None
+    latitude: float
+    longitude: float
+    profile_photo_url: str | None
+    distance_km: float
+
+
+class NearbyResponse(BaseModel):
+    items: list[NearbyProfile]
+    next_cursor: str | None
+
+
+@router.get("/nearby", response_model=NearbyResponse)
+async def nearby(
+    lat: float = Query(ge=-90, le=90),
+    lon: float = Query(ge=-180, le=180),
+    radius_km: float | None = Query(default=None, gt=0),
+    category: list[Literal['Vendor', 'Women Merchant']] = Query(default=list(MERCHANT_CATEGORIES)),
+    limit: int = Query(default=20, ge=1, le=100),
+    cursor: str | None = None,
+    creds: HTTPAuthorizationCredentials = Depends(security),
+    db: AsyncSession = Depends(get_read_db),
+):
+    """Profiles nearest to (lat, lon), closest first.
+
+    With radius_km, everything within that radius (capped by settings);
+    without it, the nearest `limit` per page out to the configured maximum.
+    Pass the returned next_cursor to get the following page.
+    """
+    _current_user_id(creds)
+    s = get_settings()
+    max_radius = min(radius_km or s.nearby_max_radius_km, s.nearby_max_radius_km)
+    after = _decode_cursor(cursor) if cursor else None
+
+    # Grow the search circle until it holds a full page. Everything inside
+    # the circle is ranked exactly, so the page is correct at any radius.
+    radius = min(s.nearby_initial_radius_km, max_radius)
+    while True:
+        page, more = await _nearest(db, lat, lon, radius, category, after, limit)
+        if more or radius >= max_radius:
+            break
+        radius = min(radius * 2, max_radius)
+
+    profiles = {}
+    if page:
+        result = await db.execute(
+            select(UserProfile.id, UserProfile.full_name, UserProfile.category, UserProfile.city,
+                   UserProfile.latitude, UserProfile.longitude, _photo_url_column())
+            .where(UserProfile.id.in_([user_id for _, user_id in page]))
+        )
+        profiles = {str(row.id): row for row in result}
+
+    items = []
+    for distance, user_id in page:
+        row = profiles.get(user_id)
+        if row is None:
+            continue  # Deleted between the two queries
+        items.append({
+            "id": user_id,
+            "full_name": row.full_name,
+            "category": row.category,
+            "city": row.city,
+            "latitude": float(row.latitude),
+            "longitude": float(row.longitude),
+            "profile_photo_url": row.profile_photo_url,
+            "distance_km": round(distance, 3),
+        })
+    next_cursor = _encode_cursor(*page[-1]) if more else None
+    return {"items": items, "next_cursor": next_cursor}
+
+
+def _decode_directory_cursor(cursor: str) -> tuple[str, UUID]:
+    try:
+        full_name, user_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return str(full_name), UUID(user_id)
+    except (binascii.Error, ValueError, TypeError, AttributeError):
+        raise HTTPException(status_code=400, detail="invalid_cursor")
+
+
+class DirectoryCard(BaseModel):
+    id: str
+    full_name: str
+    category: str
+    city: str | None
+    state: str | None
+    pincode: str | None
+    profile_photo_url: str | None
+
+
+class DirectoryResponse(BaseModel):
+    items: list[DirectoryCard]
+    next_cursor: str | None
+
+
+@router.get("/directory", response_model=DirectoryResponse)
+async def directory(
+    category: list[Literal['Vendor', 'Women Merchant']] = Query(default=list(MERCHANT_CATEGORIES)),
+    city: str | None = None,
+    state: str | None = None,
+    pincode: str | None = None,
+    limit: int = Query(default=20, ge=1, le=100),
+    cursor: str | None = None,
+    creds: HTTPAuthorizationCredentials = Depends(security),
+    db: AsyncSession = Depends(get_read_db),
+):
+    """Merchants by name, filtered by exact city/state/pincode.
+
+    Pages are keyed on (full_name, id): pass the returned next_cursor to get
+    the following page. Each category is read as one range of its
+    (category, [city|state|pincode,] full_name, id) index and the ranges are
+    merged, so a page costs the same however deep it is.
+    """
+    _current_user_id(creds)
+    after = _decode_directory_cursor(cursor) if cursor else None
+    columns = (UserProfile.id, UserProfile.full_name, UserProfile.category, UserProfile.city,
+               UserProfile.state, UserProfile.pincode, _photo_url_column())
+
+    branches = []
+    for name in dict.fromkeys(category):
+        query = select(*columns).where(UserProfile.category == name)
+        if city is not None:
+            query = query.where(UserProfile.city == city)
+        if state is not None:
+            query = query.where(UserProfile.state == state)
+        if pincode is not None:
+            query = query.where(UserProfile.pincode == pincode)
+        if after is not None:
+            query = query.where(tuple_(UserProfile.full_name, UserProfile.id) > tuple_(*after))
+        branches.append(query.order_by(UserProfile.full_name, UserProfile.id).limit(limit + 1))
+
+    if len(branches) == 1:
+        query = branches[0]
+    else:
+        merged = union_all(*(b.subquery().select() for b in branches)).subquery()
+        query = select(merged).order_by(merged.c.full_name, merged.c.id).limit(limit + 1)
+    rows = (await db.execute(query)).all()
+
+    items = []
+    for row in rows[:limit]:
+        items.append({
+            "id": str(row.id),
+            "full_name": row.full_name,
+            "category": row.category,
+            "city": row.city,
+            "state": row.state,
+            "pincode": row.pincode,
+            "profile_photo_url": row.profile_photo_url,
+        })
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = _encode_cursor(last.full_name, str(last.id))
+    return {"items": items, "next_cursor": next_cursor}
+
+
+# Public card fields /user/batch may return; contact details and exact
+# locations are not exposed to other users
+BATCH_FIELDS = ("id", "full_name", "category", "city", "profile_photo_url")
+
+
+class BatchRequest(BaseModel):
+    ids: list[UUID] = Field(min_length=1, max_length=500)
+
+
+def _batch_value(name: str, value):
+    if name == "id":
+        return str(value)
+    return value
+
+
+@router.post("/batch")
+async def batch(
+    payload: BatchRequest,
+    fields: str | None = Query(default=None, description="Comma-separated subset of profile fields"),
+    creds: HTTPAuthorizationCredentials = Depends(security),
+    db: AsyncSession = Depends(get_read_db),
+):
+    """Several merchant cards in one query, in request order; unknown ids
+    (and non-merchants) are listed under missing"""
+    _current_user_id(creds)
+    names = list(BATCH_FIELDS)
+    if fields:
+        names = [f.strip() for f in fields.split(",") if f.strip()]
+        unknown = [f for f in names if f not in BATCH_FIELDS]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"unknown_fields: {','.join(unknown)}")
+    # id is always loaded to match rows back to the request
+    columns = [
+        _photo_url_column() if f == "profile_photo_url" else getattr(UserProfile, f)
+        for f in dict.fromkeys(["id", *names])
+    ]
+    ids = list(dict.fromkeys(payload.ids))
+
+    result = await db.execute(
+        select(*columns).where(UserProfile.id.in_(ids), UserProfile.category.in_(MERCHANT_CATEGORIES))
+    )
+    rows = {row.id: row for row in result}
+
+    items, missing = [], []
+    for user_id in ids:
+        row = rows.get(user_id)
+        if row is None:
+            missing.append(str(user_id))
+            continue
+        items.append({name: _batch_value(name, getattr(row, name)) for name in names})
+    # Fields vary with the projection, so there is no response model; the
+    # values are already JSON types
+    return FastJSONResponse({"items": items, "missing": missing})
+
+
+@router.get("/{user_id}/photo")
+async def photo(
+    user_id: UUID,
+    request: Request,
+    size: int | None = Query(default=None, gt=0),
+    fmt: str | None = Query(default=None, alias="format"),
+    db: AsyncSession = Depends(get_read_db),
+):
+    # Metadata first; the bytes are only read once If-None-Match has missed
+    data = None
+    data_query = None
+    variant_key = ""
+    vary = {}
+    target = pick_variant_size(size) if size and variants_available() else None
+    if target is not None:
+        fmt = negotiate_format(fmt, request.headers.get("accept"))
+        vary = {"Vary": "Accept"}
+        # Only variants rendered from the current original count
+        variant_filter = (
+            UserProfilePhotoVariant.user_id == user_id,
+            UserProfilePhotoVariant.size == target,
+            UserProfilePhotoVariant.format == fmt,
+        )
+        result = await db.execute(
+            select(UserProfilePhotoVariant.source_sha256)
+            .join(UserProfilePhoto, UserProfilePhoto.user_id == UserProfilePhotoVariant.user_id)
+            .where(*variant_filter, UserProfilePhotoVariant.source_sha256 == UserProfilePhoto.sha256)
+        )
+        digest = result.scalar()
+        if digest is not None:
+            mime_type = VARIANT_FORMATS[fmt]
+            variant_key = f"-{target}.{fmt}"
+            data_query = select(UserProfilePhotoVariant.data).where(
+                *variant_filter, UserProfilePhotoVariant.source_sha256 == digest
+            )
+
+    if data_query is None:
+        result = await db.execute(
+            select(UserProfilePhoto.mime_type, UserProfilePhoto.sha256).where(UserProfilePhoto.user_id == user_id)
+        )
+        row = result.first()
+        if row:
+            mime_type, digest = row
+            data_query = select(UserProfilePhoto.data).where(
+                UserProfilePhoto.user_id == user_id, UserProfilePhoto.sha256 == digest
+            )
+        else:
+            # Rows written before user_profile_photos existed still carry base64
+            # inline; the digest needs the bytes anyway
+            result = await db.execute(
+                select(UserProfile.profile_photo_data, UserProfile.profile_photo_mime_type)
+                .where(UserProfile.id == user_id)
+            )
+            legacy = result.first()
+            if not legacy or not legacy[0]:
+                raise HTTPException(status_code=404, detail="not_found")
+            data = base64.b64decode(legacy[0])
+            mime_type = legacy[1]
+            digest = hashlib.sha256(data).hexdigest()
+
+    if mime_type not in PHOTO_MIME_TYPES:
+        # Never let a stored type like text/html render from the API origin
+        mime_type = "application/octet-stream"
+
+    etag = f'"{digest}{variant_key}"'
+    # Versioned URLs (?v=<digest prefix>) never change content, so they can be
+    # cached forever - unless a size was asked for and the variant isn't rendered yet
+    fallback = target is not None and not variant_key
+    version = request.query_params.get("v", "")
+    if len(version) >= PHOTO_VERSION_LENGTH and digest.startswith(version) and not fallback:
+        cache_control = "public, max-age=31536000, immutable"
+    else:
+        cache_control = "public, no-cache"
+    headers = {"ETag": etag, "Cache-Control": cache_control, "X-Content-Type-Options": "nosniff", **vary}
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in [t.strip() for t in if_none_match.split(",")]):
+        return Response(status_code=304, headers=headers)
+    if data is None:
+        data = (await db.execute(data_query)).scalar()
+        if data is None:
+            # Replaced between the two queries; the new photo has another URL
+            raise HTTPException(status_code=404, detail="not_found")
+    return Response(content=data, media_type=mime_type, headers=headers)
@@ -1,13 +1,48 @@
+"""
+Production entry point.
+
+Replaces this process with gunicorn running the gateway on uvicorn workers
+(settings in gunicorn.conf.py), so SIGTERM from the platform reaches the
+gunicorn master directly. Where gunicorn is unavailable (Windows) it falls
+back to uvicorn's own multi-process mode, without preloading.
+"""
+
 import sys
 import os
 
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
 # Add the current directory to Python path
-sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
 
-# Import the app after setting the path
-from gateway.main import app
 
-if __name__ == "__main__":
+def main():
+    os.chdir(BACKEND_DIR)
+    try:
+        import gunicorn  # noqa: F401
+    except ImportError:
+        gunicorn = None
+
+    if gunicorn is not None:
+        args = [sys.executable, "-m", "gunicorn", "-c", os.path.join(BACKEND_DIR, "gunicorn.conf.py"), "gateway.main:app"]
+        os.execv(sys.executable, args)
+
     import uvicorn
+    from common.config import get_settings
+    from common.cpus import available_cpus
+    s = get_settings()
     port = int(os.environ.get("PORT", 8000))
-    uvicorn.run("gateway.main:app", host="0.0.0.0", port=port, reload=False)
\ No newline at end of file
+    uvicorn.run(
+        "gateway.main:app",
+        host="0.0.0.0",
+        port=port,
+        workers=s.web_concurrency or available_cpus(),
+        backlog=s.web_backlog,
+        timeout_keep_alive=s.web_keepalive_seconds,
+        limit_concurrency=s.web_limit_concurrency or None,
+        timeout_graceful_shutdown=s.web_graceful_timeout_seconds,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
 #!/bin/bash
 cd backend
 export PYTHONPATH="${PYTHONPATH}:$(pwd)"
-python start.py
\ No newline at end of file
+exec python start.py